@@ -40,11 +40,97 @@
 # Add -p or --perf to report the hit/miss ratio.
 # Add -d or --dist to report the distribution of loads, stores, and atomic ops.
 # These distributions may not add up to 100; this is because of flushes or invalidations.
+# Add -e numpy or --engine numpy to replay the log with the vectorized NumPy engine,
+# which parses the log into arrays and replays them. The loops that parse the lines and
+# replay the accesses cannot be vectorized, since the outcome of an access depends on those
+# to its set before it, so they are compiled with Numba if it is installed (pip install numba).
+# Logs of 4 million records or more then replay over 10 times faster than with the python
+# engine (see CacheSimBench.py); shorter logs gain less, as loading Numba takes about 0.6 s.
+# Without Numba, the loops run in Python and large logs replay 3 to 8 times faster.
+# Add --sweep SETSxWAYSxLINEBYTES ... to replay the log once through each listed geometry
+# and print a hit/miss/writeback table, e.g. --sweep 64x4x64 128x4x64 64x8x64
+# The address length A is used for every geometry; the tag length is derived from it.
+# Add --stack-distance [SETS ...] to compute LRU stack distances for the line size given by
+# L, A, and T and print the true-LRU miss rate versus associativity for each number of sets
+# (every power of 2 up to L by default). With -v, the per-set histograms are printed too.
+# Logs compressed with gzip (.gz) or zstd (.zst, needs the zstandard package) are read
+# directly. The numpy engine and --sweep read the log in fixed-size chunks, so their
+# memory use does not grow with the length of the log.
+# Logs converted to the binary trace format with CacheTraceConvert.py are memory-mapped
+# instead of parsed, which makes repeated replays of the same log much faster.
+# Binary traces can be replayed by every mode except the python engine.
+# Add -j N or --jobs N to replay the tests of the log on N cores with the numpy engine.
+# The cache is invalidated at every BEGIN/TRAIN marker, so the tests are independent.
+# Add --policy P ... to compare replacement policies (plru, lru, fifo, random, srrip, brrip).
+# Only plru, which Wally implements, is checked against the log; any other policy, or more
+# than one, prints the --sweep table for the geometry (or each --sweep geometry) instead.
+# --seed sets the seed of the random policy.
+# Add -t or --traffic to report the bytes moved between the cache and the next level: line
+# fills read, and writebacks of dirty victims and of lines cleaned by cbo.clean, cbo.flush,
+# and flushes written. With --sweep or --policy it adds read/written columns to the table.
+# --write-through and --no-write-allocate simulate write policies Wally does not implement,
+# so, like other policies, they print the table instead of checking the log. Each write that
+# passes the cache then counts --word-bytes (8 by default) bytes of write traffic.
+# Add --checkpoint SNAPSHOT to save the cache state, the position in the log, and the
+# counts to SNAPSHOT every --checkpoint-interval records (10 million by default) during a
+# numpy engine replay. --resume continues the replay from the last snapshot after a crash,
+# and --resume SNAPSHOT --limit N replays the N records after a snapshot on the warm cache.
+# Mismatches found before the snapshot are counted but not printed again.
+# The log can be a named pipe (mkfifo ICache.log DCache.log in the directory the simulator
+# runs in, before it starts), so that each access is checked as the simulation logs it,
+# without writing the log to disk. Add --stop-on-mismatch to stop at the first mismatch;
+# closing the pipe then ends the simulation when it next writes to the log.
+# Add --miss-report [N] to see where the misses of the L, W, A, T cache come from: the
+# misses and evictions of each set, and the N sets, lines, --region-bytes regions, and
+# functions with the most misses. Functions are found with the address maps the testbench
+# reads (ref.elf.objdump.addr and .lab next to the memfile named by each BEGIN line of a
+# text log), or with --addr-map FILE.addr for the whole log. For a D$ log, they are the
+# symbols holding the data. With -v, every set is listed.
+# Add --l2 SETSxWAYSxLINEBYTES to replay the log through a two-level hierarchy: an L1 D$
+# with the geometry given by L, W, A, and T, an L1 I$ of the same geometry replaying the
+# log given by --icache-log, and a shared L2, --inclusion inclusive (the default) or
+# exclusive. It prints the miss rate and average memory access time of each level, using
+# --latency L1 L2 MEM cycles (1 10 100 by default). The logs have no timestamps, so the
+# records of each test of the two logs are interleaved evenly, in proportion to their
+# position within the test. All levels use the first --policy.
+# Add --prefetch P ... to see what a prefetcher would buy the L, W, A, T cache: nextline
+# (the next --prefetch-degree lines after each miss or use of a prefetched line), stride
+# (strides between the misses within each of --prefetch-entries pages, found without the
+# PC), or stream (--prefetch-entries stream buffers of --prefetch-degree lines). Each is
+# replayed beside the cache without a prefetcher and reported with its coverage (misses
+# removed), accuracy (prefetches used), lateness (used before they arrived, taking
+# --prefetch-latency accesses), and extra line reads. Prefetches stay within a 4 KiB page.
 
 import math
 import argparse
 import os
+import io
 import sys
+import gzip
+import re
+import stat
+from collections import namedtuple, Counter, OrderedDict, deque
+from multiprocessing import Pool
+from multiprocessing.pool import AsyncResult
+try:
+    import numpy as np # only needed by the numpy engine
+except ImportError:
+    np = None
+
+# The loops of the numpy engine that cannot be vectorized are also written for Numba
+# (pip install numba), which compiles them to machine code on first use and caches
+# that, so later runs skip the compiling too. Returns the compiled function, or None
+# if Numba is not installed and the caller has to do without.
+KERNELS = {}
+def compiled(function):
+    if function not in KERNELS:
+        try:
+            import numba
+        except ImportError:
+            KERNELS[function] = None
+        else:
+            KERNELS[function] = numba.njit(cache=True, nogil=True)(function)
+    return KERNELS[function]
 
 class CacheLine:
     def __init__(self):
@@ -203,6 +289,1413 @@ class Cache:
         return self.__str__()
 
 
+##################################
+# NumPy trace-replay engine
+##################################
+
+# A parsed log, one element per record.
+# addr:    the physical address of the record (0 for BEGIN/TRAIN/END markers)
+# op:      the ASCII code of the operation (R, W, A, Z, F, I, V, L, C) or of the
+#          first letter of the marker (B, T, E)
+# result:  the ASCII code of the outcome Wally logged (H, M, E, D, X; 0 for markers)
+# width:   the number of hex digits the address was logged with, so mismatches
+#          can be reported exactly as they appear in the log
+Trace = namedtuple("Trace", ['addr', 'op', 'result', 'width'])
+
+ACCESSOPS = b'RWAZ'
+WRITEOPS = b'WAZ'
+CBOOPS = b'VLC'
+# maps each op to the result of an access that hits, or 0 for the other ops
+ACCESSHITS = bytes(ord('H') if op in ACCESSOPS else 0 for op in range(256))
+MARKERS = {'BEGIN': ord('B'), 'TRAIN': ord('T'), 'END': ord('E')}
+
+def tokenizelog(data):
+    # Slow but forgiving parser, used for logs the vectorized parser does not recognize
+    addrs, ops, results, widths = [], [], [], []
+    for ln in data.decode(errors="ignore").splitlines():
+        lninfo = ln.split()
+        if len(lninfo) < 3:
+            if len(lninfo) > 0 and lninfo[0] in MARKERS:
+                addrs.append(0)
+                ops.append(MARKERS[lninfo[0]])
+                results.append(0)
+                widths.append(0)
+        else:
+            addrs.append(int(lninfo[0], 16))
+            ops.append(ord(lninfo[1][0]))
+            results.append(ord(lninfo[2][0]))
+            widths.append(len(lninfo[0]))
+    return Trace(np.array(addrs, dtype=np.uint64), np.array(ops, dtype=np.uint8),
+                 np.array(results, dtype=np.uint8), np.array(widths, dtype=np.uint8))
+
+# whether a line that starts like a marker is one
+def ismarkerline(line):
+    words = line.split()
+    return len(words) <= 2 and words[0].decode() in MARKERS
+
+# Parses the lines parselog handles into the given arrays for Numba to compile (see
+# compiled), along with the offset of each line, and returns the number of records,
+# or -1 at the first line it does not handle. Markers are left for the caller to check.
+def parseloop(buf, addr, op, result, width, starts):
+    n, start = 0, 0
+    while start < len(buf):
+        end = start
+        while end < len(buf) and buf[end] != 10: # newline
+            if buf[end] == 13: # carriage return
+                return -1
+            end += 1
+        if end > start:
+            first = buf[start]
+            if first == 66 or first == 84 or first == 69: # B, T, and E
+                addr[n], op[n], result[n], width[n] = 0, first, 0, 0
+            else:
+                digitcount = end - start - 4
+                if digitcount < 1 or digitcount > 16 or buf[end - 2] != 32 or buf[end - 4] != 32:
+                    return -1
+                value = np.uint64(0)
+                for digit in buf[start:start + digitcount]:
+                    if 48 <= digit <= 57: # 0-9
+                        digit -= 48
+                    elif 97 <= digit <= 102: # a-f
+                        digit -= 87
+                    elif 65 <= digit <= 70: # A-F
+                        digit -= 55
+                    else:
+                        return -1
+                    value = (value << np.uint64(4)) | np.uint64(digit)
+                addr[n], op[n], result[n], width[n] = value, buf[end - 3], buf[end - 1], digitcount
+            starts[n] = start
+            n += 1
+        start = end + 1
+    return n
+
+def parselog(data):
+    # Parses the text written by loggers.sv into a Trace without a Python loop per line,
+    # with the compiled parseloop if Numba is installed and otherwise with NumPy.
+    # Every address line has the form '<hex> <op> <result>' and every other line is a
+    # marker, so each field can be located from the position of the newline.
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if len(buf) == 0:
+        return tokenizelog(data)
+    kernel = compiled(parseloop)
+    if kernel:
+        size = data.count(b'\n') + 1
+        trace = Trace(np.empty(size, dtype=np.uint64), np.empty(size, dtype=np.uint8),
+                      np.empty(size, dtype=np.uint8), np.empty(size, dtype=np.uint8))
+        starts = np.empty(size, dtype=np.int64)
+        n = kernel(buf, *trace, starts)
+        if n >= 0:
+            markers = []
+            for start in starts[:n][trace.width[:n] == 0].tolist():
+                end = data.find(b'\n', start)
+                markers.append(data[start:end if end >= 0 else len(data)])
+            if all(map(ismarkerline, markers)):
+                return slicetrace(trace, 0, n)
+    ends = np.flatnonzero(buf == ord('\n'))
+    if buf[-1] != ord('\n'):
+        ends = np.append(ends, len(buf))
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    lengths = ends - starts
+    ends, starts, lengths = ends[lengths > 0], starts[lengths > 0], lengths[lengths > 0]
+
+    padded = np.append(buf, np.uint8(0)) # so the last line can always be indexed past its end
+    first = padded[starts]
+    ismarker = np.isin(first, np.frombuffer(b'BTE', dtype=np.uint8))
+    isaddr = ~ismarker & (lengths >= 5) & (padded[ends - 2] == ord(' ')) & (padded[ends - 4] == ord(' '))
+    width = np.where(isaddr, lengths - 4, 0)
+    if not np.all(ismarker | isaddr) or (len(width) and width.max() > 16) or np.any(buf == ord('\r')):
+        return tokenizelog(data)
+    # markers are rare, so checking their words one at a time costs nothing
+    if not all(ismarkerline(data[start:end]) for start, end in zip(starts[ismarker].tolist(), ends[ismarker].tolist())):
+        return tokenizelog(data)
+
+    # translate the whole log to nibbles at once; anything that is not a hex digit becomes 255
+    hexdigits = bytearray([255])*256
+    for value, char in enumerate(b'0123456789abcdef'):
+        hexdigits[char] = value
+    for value, char in enumerate(b'ABCDEF'):
+        hexdigits[char] = value + 10
+    nibbles = np.frombuffer(data.translate(hexdigits) + b'\xff', dtype=np.uint8)
+
+    # the logger writes every address at the full width of PAdrM, so there are only a
+    # couple of distinct widths and each can be decoded as a 2-D block of digits
+    addr = np.zeros(len(starts), dtype=np.uint64)
+    for digitcount in np.unique(width[isaddr]):
+        lines = np.flatnonzero(isaddr & (width == digitcount))
+        digits = nibbles[starts[lines, None] + np.arange(digitcount)]
+        if np.any(digits == 255):
+            return tokenizelog(data)
+        value = np.zeros(len(lines), dtype=np.uint64)
+        for digit in range(digitcount):
+            value = (value << np.uint64(4)) | digits[:, digit]
+        addr[lines] = value
+
+    keep = ismarker | isaddr
+    op = np.where(isaddr, padded[ends - 3], first)
+    result = np.where(isaddr, padded[ends - 1], 0)
+    return Trace(addr[keep], op[keep].astype(np.uint8), result[keep].astype(np.uint8), width[keep].astype(np.uint8))
+
+# bytes of log parsed at a time by readchunks
+CHUNKBYTES = 4 << 20
+
+# opens a plain, gzip (.gz), or zstd (.zst) compressed log
+def openlog(filename, mode='rb'):
+    filename = os.path.expanduser(filename)
+    if filename.endswith('.gz'):
+        f = gzip.open(filename, 'rb')
+    elif filename.endswith('.zst'):
+        try:
+            import zstandard
+        except ImportError:
+            sys.exit("Error: reading .zst logs requires the zstandard package (pip install zstandard)")
+        f = zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'), closefd=True)
+    else:
+        f = open(filename, 'rb')
+    return f if mode == 'rb' else io.TextIOWrapper(f)
+
+# Binary trace format: a 16-byte header holding BINMAGIC and the number of hex
+# digits addresses were logged with, followed by one 10-byte record per line of
+# the text log: a little-endian 8-byte address, the op byte, and the result byte,
+# stored exactly as in a Trace (markers have op B, T, or E and address 0).
+BINMAGIC = b'WALLYCT1'
+BINHEADER = 16
+BINFIELDS = [('addr', '<u8'), ('op', 'u1'), ('result', 'u1')]
+
+# Named pipes are read as they are written and can only be read once, so they are
+# read in whatever amounts are available and never probed for the binary format
+# (the loggers write text).
+def isfifo(filename):
+    return stat.S_ISFIFO(os.stat(os.path.expanduser(filename)).st_mode)
+
+def isbinarylog(filename):
+    if isfifo(filename):
+        return False
+    with open(os.path.expanduser(filename), 'rb') as f:
+        return f.read(len(BINMAGIC)) == BINMAGIC
+
+# converts a text log (optionally compressed) to the binary trace format
+def writebinarylog(textfile, binfile):
+    width = 0
+    records = 0
+    with open(os.path.expanduser(binfile), 'wb') as f:
+        f.write(bytes(BINHEADER))
+        for trace in readchunks(textfile):
+            chunk = np.zeros(len(trace.op), dtype=np.dtype(BINFIELDS))
+            chunk['addr'], chunk['op'], chunk['result'] = trace.addr, trace.op, trace.result
+            f.write(chunk.tobytes())
+            width = max(width, int(trace.width.max()) if len(trace.width) else 0)
+            records += len(chunk)
+        f.seek(0)
+        f.write(BINMAGIC + bytes([width]))
+    return records
+
+# yields the records of a binary trace straight from a memory map, with the
+# file offset just past each chunk
+def readbinarychunks(filename, chunkbytes=CHUNKBYTES, start=0):
+    with open(os.path.expanduser(filename), 'rb') as f:
+        width = f.read(BINHEADER)[len(BINMAGIC)]
+    if os.path.getsize(os.path.expanduser(filename)) == BINHEADER:
+        return
+    records = np.memmap(os.path.expanduser(filename), dtype=np.dtype(BINFIELDS), mode='r', offset=BINHEADER)
+    step = max(chunkbytes // records.itemsize, 1)
+    for first in range(max(start - BINHEADER, 0) // records.itemsize, len(records), step):
+        chunk = records[first:first + step]
+        op = np.ascontiguousarray(chunk['op'])
+        yield (Trace(np.ascontiguousarray(chunk['addr'], dtype=np.uint64), op, np.ascontiguousarray(chunk['result']),
+                     np.where(np.isin(op, np.frombuffer(b'BTE', dtype=np.uint8)), 0, width).astype(np.uint8)),
+               BINHEADER + (first + len(chunk))*records.itemsize)
+
+# parses a log one block at a time from byte offset start of the uncompressed
+# log, which must be the start of a line, and yields a Trace for each block that
+# ends on a line boundary, with the offset just past it
+# If names is a list, the names of the BEGIN markers (see beginnames) of each
+# block are appended to it before its Trace is yielded.
+def readchunkoffsets(filename, chunkbytes=CHUNKBYTES, start=0, names=None):
+    if isbinarylog(filename):
+        yield from readbinarychunks(filename, chunkbytes, start)
+        return
+    with openlog(filename) as f:
+        if start:
+            f.seek(start) # compressed logs are decompressed up to the offset
+        read = f.read1 if isfifo(filename) else f.read
+        offset = start
+        partial = b''
+        while True:
+            block = read(chunkbytes)
+            if not block:
+                break
+            block = partial + block
+            cut = block.rfind(b'\n') + 1
+            partial = block[cut:]
+            if cut:
+                offset += cut
+                if names is not None:
+                    names.extend(beginnames(block[:cut]))
+                yield parselog(block[:cut]), offset
+        if partial:
+            if names is not None:
+                names.extend(beginnames(partial))
+            yield parselog(partial), offset + len(partial)
+
+def readchunks(filename, chunkbytes=CHUNKBYTES, names=None):
+    for trace, _ in readchunkoffsets(filename, chunkbytes, names=names):
+        yield trace
+
+def concattraces(traces):
+    if len(traces) == 1:
+        return traces[0]
+    return Trace(*(np.concatenate(field) for field in zip(*traces)))
+
+def slicetrace(trace, start, end):
+    return Trace(*(field[start:end] for field in trace))
+
+# parses a whole log into one Trace
+def readlog(filename):
+    traces = list(readchunks(filename))
+    if not traces:
+        return parselog(b'')
+    return concattraces(traces)
+
+# records per job handed to a worker by --jobs
+JOBRECORDS = 1 << 20
+
+# Regroups the chunks of a trace at BEGIN/TRAIN markers for parallel replay.
+# Yields (trace, mode) where mode is
+#   'job':   whole tests that can be replayed on an empty cache by any process
+#   'first': the start of a test too long to be a job, replayed on an empty cache
+#   'next':  more of that test, replayed on the same cache as the piece before it
+def splitjobs(traces, jobrecords=JOBRECORDS):
+    done, donesize = [], 0 # complete tests not yet handed out
+    test, testsize = [], 0 # the test being read
+    longtest = False
+    for trace in traces:
+        cuts = np.flatnonzero(np.isin(trace.op, np.frombuffer(b'BT', dtype=np.uint8))).tolist()
+        starts = sorted({0, *cuts})
+        newtest = set(cuts)
+        for start, end in zip(starts, [*starts[1:], len(trace.op)]):
+            if start in newtest: # a new test begins, so the one being read is complete
+                if longtest and test:
+                    yield concattraces(test), 'next'
+                elif test:
+                    done += test
+                    donesize += testsize
+                test, testsize, longtest = [], 0, False
+                if donesize >= jobrecords:
+                    yield concattraces(done), 'job'
+                    done, donesize = [], 0
+            if end > start:
+                test.append(slicetrace(trace, start, end))
+                testsize += end - start
+            if testsize >= jobrecords:
+                if done:
+                    yield concattraces(done), 'job'
+                    done, donesize = [], 0
+                yield concattraces(test), 'next' if longtest else 'first'
+                test, testsize, longtest = [], 0, True
+    if longtest and test:
+        yield concattraces(test), 'next'
+    elif test:
+        done += test
+    if done:
+        yield concattraces(done), 'job'
+
+##################################
+# Replacement policies for ArrayCache
+##################################
+
+# A replacement policy keeps its state in the numpy array self.state between
+# replays. While replaying, unpack() copies it into the list self.s, which is
+# much faster to index from Python, and pack() copies it back. Ways are
+# numbered within a set; per-line state is indexed by setnum*numways + waynum.
+class ReplacementPolicy:
+    def __init__(self, numsets, numways, seed=1):
+        self.numsets = numsets
+        self.numways = numways
+        self.state = np.zeros(numsets*numways, dtype=np.uint64)
+
+    def unpack(self):
+        self.s = self.state.tolist()
+
+    def pack(self):
+        self.state[:] = self.s
+
+    # forgets all history, as when a new test starts
+    def reset(self):
+        self.s = [0]*len(self.s)
+
+    # a hit on the given way
+    def touch(self, setnum, waynum):
+        pass
+
+    # a line was just loaded into the given way
+    def fill(self, setnum, waynum):
+        self.touch(setnum, waynum)
+
+    # the way to evict from a full set
+    def victim(self, setnum):
+        raise NotImplementedError
+
+class TreePLRU(ReplacementPolicy):
+    # The tree pseudo-LRU Wally implements. Each set's tree is packed into an int
+    # with bit i holding node i of the tree that Cache.update_pLRU walks.
+    def __init__(self, numsets, numways, seed=1):
+        super().__init__(numsets, numways, seed)
+        self.state = np.zeros(numsets, dtype=np.uint32)
+        # bits to clear and set in a tree when a way is accessed
+        self.clear = []
+        self.set = []
+        for waynum in range(numways):
+            clear, setbits = 0, 0
+            if numways > 1:
+                index = (waynum // 2) + (numways - 1) // 2
+                bit = int(not waynum % 2)
+                while True:
+                    clear |= 1 << index
+                    setbits |= bit << index
+                    if index == 0:
+                        break
+                    bit = index % 2
+                    index = (index - 1) // 2
+            self.clear.append(~clear)
+            self.set.append(setbits)
+        # victim way for every possible tree, small enough to tabulate for any real cache
+        self.victims = [self.getvictimway(tree) for tree in range(1 << max(numways - 1, 0))] if numways <= 16 else None
+
+    # uses the packed psuedo-LRU tree to select a victim way, like Cache.getvictimway
+    def getvictimway(self, tree):
+        if self.numways == 1:
+            return 0
+        index = 0
+        bottomrow = (self.numways - 1) // 2
+        while index < bottomrow:
+            index = index*2 + 1 + ((tree >> index) & 1)
+        return (index - bottomrow)*2 + ((tree >> index) & 1)
+
+    def touch(self, setnum, waynum):
+        self.s[setnum] = (self.s[setnum] & self.clear[waynum]) | self.set[waynum]
+
+    def victim(self, setnum):
+        return self.victims[self.s[setnum]] if self.victims else self.getvictimway(self.s[setnum])
+
+class TrueLRU(ReplacementPolicy):
+    # Each line holds the time it was last used; the oldest line is evicted.
+    def unpack(self):
+        super().unpack()
+        self.clock = max(self.s) + 1
+
+    def touch(self, setnum, waynum):
+        self.s[setnum*self.numways + waynum] = self.clock
+        self.clock += 1
+
+    def victim(self, setnum):
+        stamps = self.s[setnum*self.numways:(setnum + 1)*self.numways]
+        return stamps.index(min(stamps))
+
+class FIFO(TrueLRU):
+    # Like TrueLRU, but only loading a line sets its time, so the oldest line is evicted.
+    def touch(self, setnum, waynum):
+        pass
+
+    def fill(self, setnum, waynum):
+        TrueLRU.touch(self, setnum, waynum)
+
+class Random(ReplacementPolicy):
+    # Evicts a pseudo-random way drawn from a xorshift64 generator seeded by --seed,
+    # so runs are repeatable. The generator state is the only state.
+    def __init__(self, numsets, numways, seed=1):
+        super().__init__(numsets, numways, seed)
+        self.state = np.array([seed or 1], dtype=np.uint64)
+
+    def reset(self):
+        pass
+
+    def victim(self, setnum):
+        x = self.s[0]
+        x ^= (x << 13) & 0xFFFFFFFFFFFFFFFF
+        x ^= x >> 7
+        x ^= (x << 17) & 0xFFFFFFFFFFFFFFFF
+        self.s[0] = x
+        return x % self.numways
+
+class SRRIP(ReplacementPolicy):
+    # Static re-reference interval prediction (Jaleel et al., ISCA 2010) with 2-bit
+    # re-reference prediction values (RRPV). Hits predict a near re-reference (0),
+    # new lines a long one (2), and the first line predicted distant (3) is evicted.
+    maxrrpv = 3
+
+    def touch(self, setnum, waynum):
+        self.s[setnum*self.numways + waynum] = 0
+
+    def fill(self, setnum, waynum):
+        self.s[setnum*self.numways + waynum] = self.maxrrpv - 1
+
+    def victim(self, setnum):
+        base = setnum*self.numways
+        rrpvs = self.s[base:base + self.numways]
+        oldest = max(rrpvs)
+        if oldest < self.maxrrpv: # age the whole set until some line is distant
+            self.s[base:base + self.numways] = [rrpv + self.maxrrpv - oldest for rrpv in rrpvs]
+        return rrpvs.index(oldest)
+
+class BRRIP(SRRIP):
+    # Bimodal RRIP: new lines are predicted distant except for one fill in 32,
+    # which keeps thrashing working sets from flushing the whole cache.
+    # The fill count is kept in the last element of the state.
+    def __init__(self, numsets, numways, seed=1):
+        super().__init__(numsets, numways, seed)
+        self.state = np.zeros(numsets*numways + 1, dtype=np.uint64)
+
+    def reset(self):
+        self.s[:-1] = [0]*(len(self.s) - 1)
+
+    def fill(self, setnum, waynum):
+        self.s[-1] += 1
+        self.s[setnum*self.numways + waynum] = self.maxrrpv - 1 if self.s[-1] % 32 == 0 else self.maxrrpv
+
+# Only plru models Wally, so only it is checked against the outcomes in the log.
+POLICIES = {'plru': TreePLRU, 'lru': TrueLRU, 'fifo': FIFO, 'random': Random, 'srrip': SRRIP, 'brrip': BRRIP}
+# the policies the compiled replay loop implements, by their code in it
+KERNELPOLICIES = {TreePLRU: 0, TrueLRU: 1, FIFO: 2, Random: 3, SRRIP: 4, BRRIP: 5}
+
+# The replay loop of ArrayCache.replayheads over arrays, for Numba to compile (see
+# compiled). Lines are found by scanning the ways of their set rather than through a
+# dict, and the replacement policies are written out, selected by their KERNELPOLICIES code,
+# with the state of each kept in the uint64 array state as its ReplacementPolicy keeps it.
+def replayloop(ops, keys, writes, dirties, runs, results, linekeys, valid, dirty, state,
+               policy, numways, setmask, writeallocate, victims, keep, setbits):
+    one, maxrrpv = np.uint64(1), np.uint64(3)
+    clock = state.max() + one if len(state) else one # TrueLRU and FIFO
+    fills = writebacks = flushes = bypasses = 0
+    for i in range(len(ops)):
+        op, key = ops[i], keys[i]
+        setnum = np.int64(key & setmask)
+        base = setnum*numways
+        if op == 82 or op == 87 or op == 65 or op == 90: # R, W, A, and Z
+            line = -1
+            for way in range(numways):
+                if valid[base + way] and linekeys[base + way] == key:
+                    line = base + way
+                    break
+            makedirty = dirties[i] or runs[i] >= 2
+            if line >= 0:
+                if makedirty:
+                    dirty[line] = True
+                touches = 1
+            elif not writeallocate and writes[i]:
+                bypasses += 1
+                results[i] = 77 # M
+                continue
+            else:
+                for way in range(numways):
+                    if not valid[base + way]:
+                        line = base + way
+                        break
+                if line >= 0:
+                    valid[line] = True
+                    results[i] = 77 # M
+                else:
+                    # the policy's victim
+                    if policy == 0: # TreePLRU
+                        line = base + victims[state[setnum]]
+                    elif policy == 1 or policy == 2: # TrueLRU and FIFO
+                        line = base
+                        for way in range(1, numways):
+                            if state[base + way] < state[line]:
+                                line = base + way
+                    elif policy == 3: # Random
+                        x = state[0]
+                        x ^= x << np.uint64(13)
+                        x ^= x >> np.uint64(7)
+                        x ^= x << np.uint64(17)
+                        state[0] = x
+                        line = base + np.int64(x % np.uint64(numways))
+                    else: # SRRIP and BRRIP
+                        oldest = state[base]
+                        line = base
+                        for way in range(1, numways):
+                            if state[base + way] > oldest:
+                                oldest = state[base + way]
+                                line = base + way
+                        if oldest < maxrrpv:
+                            for way in range(numways):
+                                state[base + way] += maxrrpv - oldest
+                    if dirty[line]:
+                        writebacks += 1
+                        results[i] = 68 # D
+                    else:
+                        results[i] = 69 # E
+                linekeys[line] = key
+                dirty[line] = makedirty
+                fills += 1
+                # the fill
+                if policy == 2: # FIFO
+                    state[line] = clock
+                    clock += one
+                elif policy == 4: # SRRIP
+                    state[line] = maxrrpv - one
+                elif policy == 5: # BRRIP
+                    state[-1] += one
+                    state[line] = maxrrpv - one if state[-1] % np.uint64(32) == 0 else maxrrpv
+                touches = 1 if policy != 2 and policy != 4 and policy != 5 else 0
+                touches += runs[i] & 1 # the rest of the run hits the line
+            for _ in range(touches):
+                if policy == 0:
+                    state[setnum] = (state[setnum] & keep[line - base]) | setbits[line - base]
+                elif policy == 1:
+                    state[line] = clock
+                    clock += one
+                elif policy == 4 or policy == 5:
+                    state[line] = 0
+        elif op == 86 or op == 76 or op == 67: # cbo V, L, and C
+            for way in range(numways):
+                line = base + way
+                if valid[line] and linekeys[line] == key:
+                    if dirty[line] and op != 86: # cbo.inval discards the data
+                        flushes += 1
+                    dirty[line] = False
+                    if op != 67:
+                        valid[line] = False
+                    break
+        elif op == 70: # F
+            for line in range(len(dirty)):
+                if dirty[line] and valid[line]:
+                    flushes += 1
+            dirty[:] = False
+        elif op == 73 or op == 66 or op == 84: # I, B, and T
+            valid[:] = False
+            if op != 73 and policy != 3: # a new test forgets the replacement history
+                state[:len(state) - 1 if policy == 5 else len(state)] = 0
+    return fills, writebacks, flushes, bypasses
+
+class ArrayCache:
+    # Functionally identical to Cache, but the state is kept in flat fixed-size arrays
+    # indexed by setnum*numways + waynum, and the replacement policy can be chosen.
+    # Wally's caches are write-back and write-allocate; a write-through cache never
+    # holds dirty lines, and without write-allocate a write miss bypasses the cache.
+    # The bytes each replay moves to and from the next level are left in self.traffic.
+    def __init__(self, numsets, numways, addrlen, taglen, policy='plru', seed=1,
+                 writethrough=False, writeallocate=True, wordbytes=8):
+        self.numways = numways
+        self.numsets = numsets
+
+        self.addrlen = addrlen
+        self.taglen = taglen
+        self.setlen = int(math.log(numsets, 2))
+        self.offsetlen = self.addrlen - self.taglen - self.setlen
+
+        self.tags = np.zeros(numsets*numways, dtype=np.uint64)
+        self.valid = np.zeros(numsets*numways, dtype=bool)
+        self.dirty = np.zeros(numsets*numways, dtype=bool)
+        self.policy = POLICIES[policy](numsets, numways, seed)
+        self.writethrough = writethrough
+        self.writeallocate = writeallocate
+        self.wordbytes = wordbytes
+        self.traffic = Counter()
+
+    def flush(self):
+        self.dirty[:] = False
+
+    def invalidate(self):
+        self.valid[:] = False
+
+    def clear_pLRU(self):
+        self.policy.unpack()
+        self.policy.reset()
+        self.policy.pack()
+
+    # splits an array of addresses into arrays of tags, sets, and offsets
+    def splitaddrs(self, addrs):
+        tag = (addrs >> np.uint64(self.setlen + self.offsetlen)) & np.uint64((1 << self.taglen) - 1)
+        setnum = (addrs >> np.uint64(self.offsetlen)) & np.uint64((1 << self.setlen) - 1)
+        offset = addrs & np.uint64((1 << self.offsetlen) - 1)
+        return tag, setnum, offset
+
+    # replays every record of a Trace through the cache and returns an array
+    # holding the ASCII code of the simulated outcome of each record
+    # (H/M/E/D for accesses, 0 for everything else)
+    # self.traffic then holds the bytes read by line fills and written by
+    # writebacks, flushes, and stores that went past the cache during the replay.
+    def replay(self, trace):
+        n = len(trace.op)
+        # tag and set together identify a line, so they are compared as one key
+        keys = (trace.addr >> np.uint64(self.offsetlen)) & np.uint64((1 << (self.taglen + self.setlen)) - 1)
+        isaccess = np.isin(trace.op, np.frombuffer(ACCESSOPS, dtype=np.uint8))
+        iswrite = np.isin(trace.op, np.frombuffer(WRITEOPS, dtype=np.uint8))
+
+        # An access to the same line as the access just before it must hit, and
+        # touching the same way again leaves the replacement state unchanged, so only
+        # the first access of each such run is simulated. The rest only touch the way
+        # once, in case the first access missed, and add dirtiness.
+        # A write miss that does not allocate leaves the next access to the line
+        # free to miss, so without write-allocate every access is simulated.
+        follower = np.zeros(n, dtype=bool)
+        if n > 1 and self.writeallocate:
+            follower[1:] = isaccess[1:] & isaccess[:-1] & (keys[1:] == keys[:-1])
+        heads = np.flatnonzero(~follower)
+        results = np.where(isaccess, ord('H'), 0).astype(np.uint8)
+        self.traffic = Counter()
+        if n == 0:
+            return results
+        # a write-through cache sends every write on and never dirties a line
+        dirties = iswrite & (not self.writethrough)
+        # bit 0: the run has more accesses, bit 1: one of them writes
+        hasfollowers = np.append(follower[1:], False)[heads]
+        runwrite = np.add.reduceat((dirties & follower).astype(np.uint8), heads) > 0
+        runs = hasfollowers.astype(np.uint8) | (runwrite.astype(np.uint8) << 1)
+
+        # the compiled loop looks victims of the tree pseudo-LRU up in its table
+        kernel = compiled(replayloop) if type(self.policy) is not TreePLRU or self.policy.victims is not None else None
+        if kernel:
+            headresults = results[heads]
+            fills, writebacks, flushes, bypasses = self.replaycompiled(
+                kernel, trace.op[heads], keys[heads], iswrite[heads], dirties[heads], runs, headresults)
+        else:
+            headresults, fills, writebacks, flushes, bypasses = self.replayheads(
+                trace.op[heads].tolist(), keys[heads].tolist(), iswrite[heads].tolist(),
+                dirties[heads].tolist(), runs.tolist())
+            headresults = np.frombuffer(headresults, dtype=np.uint8)
+        results[heads] = headresults
+        linebytes = 1 << self.offsetlen
+        stores = int(np.count_nonzero(iswrite)) if self.writethrough else bypasses
+        self.traffic = Counter(fill=fills*linebytes, writeback=writebacks*linebytes,
+                               flush=flushes*linebytes, store=stores*self.wordbytes)
+        return results
+
+    # replayheads with the compiled replay loop, which fills in results itself
+    def replaycompiled(self, kernel, ops, keys, writes, dirties, runs, results):
+        numways = self.numways
+        linekeys = (self.tags << np.uint64(self.setlen)) | (np.arange(len(self.tags), dtype=np.uint64) // np.uint64(numways))
+        policy = self.policy
+        state = policy.state.astype(np.uint64)
+        if type(policy) is TreePLRU:
+            keep = np.array(policy.clear, dtype=np.int64).astype(np.uint64)
+            setbits = np.array(policy.set, dtype=np.uint64)
+            victims = np.array(policy.victims, dtype=np.int64)
+        else:
+            keep = setbits = np.zeros(1, dtype=np.uint64)
+            victims = np.zeros(1, dtype=np.int64)
+        counts = kernel(ops, keys, writes, dirties, runs, results, linekeys, self.valid, self.dirty, state,
+                        KERNELPOLICIES[type(policy)], numways, np.uint64((1 << self.setlen) - 1),
+                        self.writeallocate, victims, keep, setbits)
+        self.tags[:] = linekeys >> np.uint64(self.setlen)
+        policy.state[:] = state
+        return counts
+
+    # returns the results and the number of line fills, dirty evictions, lines
+    # cleaned by cbos and flushes, and write misses that bypassed the cache
+    def replayheads(self, ops, keys, writes, dirties, runs):
+        # The arrays are unpacked into lists for the duration of the loop, which is
+        # much faster to index from Python, and a dict maps each valid line's key
+        # to its slot so a lookup does not have to scan the ways.
+        numways = self.numways
+        numlines = self.numsets*numways
+        setmask = (1 << self.setlen) - 1
+        linekeys = [(tag << self.setlen) | (line // numways) for line, tag in enumerate(self.tags.tolist())]
+        valid = self.valid.tolist()
+        dirty = self.dirty.tolist()
+        policy = self.policy
+        policy.unpack()
+        touch, fill, victim = policy.touch, policy.fill, policy.victim
+        # The tree pseudo-LRU that models Wally is updated in the loop itself, as calling
+        # the policy for every access would take about a third of the replay. Filling a
+        # way touches it, and touching it again leaves the tree as it is.
+        plru = type(policy) is TreePLRU and policy.victims is not None
+        if plru:
+            tree, clear, setbits, victims = policy.s, policy.clear, policy.set, policy.victims
+        where = {linekeys[line]: line for line in range(numlines) if valid[line]}
+        validcount = [sum(valid[base:base + numways]) for base in range(0, numlines, numways)]
+        # every access hits unless the loop says otherwise
+        results = bytearray(bytes(ops).translate(ACCESSHITS))
+        M, E, D = ord('M'), ord('E'), ord('D')
+        accessops, cboops = set(ACCESSOPS), set(CBOOPS)
+        F, I, B, T, C, V = ord('F'), ord('I'), ord('B'), ord('T'), ord('C'), ord('V')
+        writeallocate = self.writeallocate
+        fills = writebacks = flushes = bypasses = 0
+
+        for i, (op, key, d, run) in enumerate(zip(ops, keys, dirties, runs)):
+            if op in accessops:
+                setnum = key & setmask
+                line = where.get(key)
+                if line is not None:
+                    if d or run >= 2: # bit 1 of run: a later access of the run writes
+                        dirty[line] = True
+                    if plru:
+                        way = line - setnum*numways
+                        tree[setnum] = (tree[setnum] & clear[way]) | setbits[way]
+                    else:
+                        touch(setnum, line - setnum*numways)
+                    continue
+                if not writeallocate and writes[i]:
+                    # the write goes straight to the next level
+                    bypasses += 1
+                    results[i] = M
+                    continue
+                # fill the first empty way, otherwise evict the policy's victim
+                base = setnum*numways
+                if validcount[setnum] < numways:
+                    line = valid.index(False, base, base + numways)
+                    valid[line] = True
+                    validcount[setnum] += 1
+                    results[i] = M
+                else:
+                    line = base + (victims[tree[setnum]] if plru else victim(setnum))
+                    del where[linekeys[line]]
+                    if dirty[line]:
+                        writebacks += 1
+                        results[i] = D
+                    else:
+                        results[i] = E
+                where[key] = line
+                linekeys[line] = key
+                dirty[line] = d or run >= 2
+                fills += 1
+                way = line - base
+                if plru:
+                    tree[setnum] = (tree[setnum] & clear[way]) | setbits[way]
+                else:
+                    fill(setnum, way)
+                    if run & 1: # the rest of the run hits the line
+                        touch(setnum, way)
+            elif op in cboops:
+                line = where.get(key)
+                if line is not None:
+                    if dirty[line] and op != V: # cbo.inval discards the data
+                        flushes += 1
+                    dirty[line] = False
+                    if op != C:
+                        valid[line] = False
+                        validcount[key & setmask] -= 1
+                        del where[key]
+            elif op == F:
+                flushes += sum(d and v for d, v in zip(dirty, valid))
+                dirty = [False]*numlines
+            elif op == I or op == B or op == T:
+                valid = [False]*numlines
+                validcount = [0]*self.numsets
+                where.clear()
+                if op != I:
+                    policy.reset()
+                    if plru:
+                        tree = policy.s
+
+        self.tags[:] = [key >> self.setlen for key in linekeys]
+        self.valid[:] = valid
+        self.dirty[:] = dirty
+        policy.pack()
+        return results, fills, writebacks, flushes, bypasses
+
+    def __str__(self):
+        string = ""
+        for i in range(self.numways):
+            string += f"Way {i}: "
+            for setnum in range(self.numsets):
+                line = setnum*self.numways + i
+                string += f"(V: {bool(self.valid[line])}, D: {bool(self.dirty[line])}, Tag: {hex(int(self.tags[line]))}), "
+            string += "\n\n"
+        return string
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class LineCache:
+    # One level of a Hierarchy. A line is named by its address shifted right by the
+    # offset, and the lines are kept in lists indexed by setnum*numways + waynum
+    # (None marks an empty way), with a dict from each cached line to its slot.
+    def __init__(self, numsets, numways, linebytes, policy='plru', seed=1):
+        self.numsets = numsets
+        self.numways = numways
+        self.offsetlen = int(math.log(linebytes, 2))
+        self.keys = [None]*(numsets*numways)
+        self.dirty = [False]*(numsets*numways)
+        self.where = {}
+        self.policy = POLICIES[policy](numsets, numways, seed)
+        self.policy.unpack()
+        self.accesses = 0
+        self.misses = 0
+
+    # a demand access; returns whether it hit
+    def lookup(self, key, write=False):
+        line = self.where.get(key)
+        if line is None:
+            return False
+        if write:
+            self.dirty[line] = True
+        setnum = key & (self.numsets - 1)
+        self.policy.touch(setnum, line - setnum*self.numways)
+        return True
+
+    # loads a line and returns the key and dirtiness of the line it evicted, if any
+    def allocate(self, key, dirty):
+        setnum = key & (self.numsets - 1)
+        base = setnum*self.numways
+        line = self.where.get(key)
+        if line is not None:
+            self.dirty[line] = self.dirty[line] or dirty
+            self.policy.touch(setnum, line - base)
+            return None
+        evicted = None
+        try:
+            line = self.keys.index(None, base, base + self.numways)
+        except ValueError: # the set is full
+            line = base + self.policy.victim(setnum)
+            evicted = (self.keys[line], self.dirty[line])
+            del self.where[self.keys[line]]
+        self.keys[line] = key
+        self.dirty[line] = dirty
+        self.where[key] = line
+        self.policy.fill(setnum, line - base)
+        return evicted
+
+    # drops a line and returns whether it was dirty, or None if it was not cached
+    def remove(self, key):
+        line = self.where.pop(key, None)
+        if line is None:
+            return None
+        self.keys[line] = None
+        return self.dirty[line]
+
+    # cleans a line and returns whether it was dirty
+    def clean(self, key):
+        line = self.where.get(key)
+        if line is None or not self.dirty[line]:
+            return False
+        self.dirty[line] = False
+        return True
+
+    # cleans every line and returns the keys of the lines that were dirty
+    def flush(self):
+        dirtykeys = [self.keys[line] for line in self.where.values() if self.dirty[line]]
+        self.dirty = [False]*len(self.dirty)
+        return dirtykeys
+
+    def invalidate(self, reset=False):
+        self.keys = [None]*len(self.keys)
+        self.where.clear()
+        if reset:
+            self.policy.reset()
+
+class Hierarchy:
+    # A write-back L1 D$ and I$ in front of a shared write-back L2. An inclusive L2
+    # loads every line the L1s miss on and invalidates the L1 copies of the lines it
+    # evicts. An exclusive L2 only holds the lines the L1s evict, clean or dirty, and
+    # gives a line up to the L1 that hits on it; its lines must be as long as the L1's.
+    # Lines that reach memory are counted in memreads and memwrites.
+    def __init__(self, l1geometry, l2geometry, inclusive=True, policy='plru', seed=1):
+        self.l1 = [LineCache(*l1geometry, policy, seed) for source in range(2)] # D$, I$
+        self.l2 = LineCache(*l2geometry, policy, seed)
+        self.inclusive = inclusive
+        self.shift = self.l2.offsetlen - self.l1[0].offsetlen
+        self.farmisses = [0, 0] # misses of each L1 that missed in the L2 too
+        self.l2writes = 0 # lines the L1s wrote into the L2
+        self.backinvalidations = 0
+        self.memreads = 0
+        self.memwrites = 0
+
+    # replays merged records; sources holds 0 for D$ records and 1 for I$ records
+    def replay(self, ops, addrs, sources):
+        accessops, writeops, cboops = set(ACCESSOPS), set(WRITEOPS), set(CBOOPS)
+        F, I, B, T = ord('F'), ord('I'), ord('B'), ord('T')
+        for op, addr, source in zip(ops, addrs, sources):
+            if op in accessops:
+                self.access(source, addr, op in writeops)
+            elif op in cboops:
+                self.cbo(addr, op)
+            elif op == F:
+                self.flush(source)
+            elif op == I:
+                self.l1[source].invalidate()
+            elif op == B or op == T:
+                for cache in (*self.l1, self.l2):
+                    cache.invalidate(reset=True)
+
+    def access(self, source, addr, write):
+        l1 = self.l1[source]
+        key = addr >> l1.offsetlen
+        l1.accesses += 1
+        if l1.lookup(key, write):
+            return
+        l1.misses += 1
+        l2key = key >> self.shift
+        self.l2.accesses += 1
+        dirty = write
+        if self.l2.lookup(l2key):
+            if not self.inclusive:
+                dirty = self.l2.remove(l2key) or write # the line moves up into the L1
+        else:
+            self.l2.misses += 1
+            self.farmisses[source] += 1
+            self.memreads += 1
+            if self.inclusive:
+                self.l2allocate(l2key, False)
+        evicted = l1.allocate(key, dirty)
+        if evicted is not None:
+            evictedkey, evicteddirty = evicted
+            if evicteddirty or not self.inclusive:
+                self.l2writes += 1
+                self.l2allocate(evictedkey >> self.shift, evicteddirty)
+
+    def l2allocate(self, l2key, dirty):
+        evicted = self.l2.allocate(l2key, dirty)
+        if evicted is not None:
+            evictedkey, evicteddirty = evicted
+            if self.backinvalidate(evictedkey) or evicteddirty:
+                self.memwrites += 1
+
+    # invalidates the L1 copies of a line leaving an inclusive L2 and returns
+    # whether any of them was dirty
+    def backinvalidate(self, l2key):
+        dirty = False
+        if self.inclusive:
+            for l1 in self.l1:
+                for key in range(l2key << self.shift, (l2key + 1) << self.shift):
+                    l1dirty = l1.remove(key)
+                    if l1dirty is not None:
+                        self.backinvalidations += 1
+                        dirty = dirty or l1dirty
+        return dirty
+
+    # cbo.clean and cbo.flush write a dirty line back to memory from whichever
+    # level holds it, and cbo.flush and cbo.inval drop it from the D$ and the L2
+    def cbo(self, addr, op):
+        key = addr >> self.l1[0].offsetlen
+        l2key = key >> self.shift
+        if op == ord('C'):
+            dirty = self.l1[0].clean(key) | self.l2.clean(l2key)
+        else:
+            dirty = bool(self.l1[0].remove(key))
+            l2dirty = self.l2.remove(l2key)
+            if l2dirty is not None:
+                dirty = self.backinvalidate(l2key) or l2dirty or dirty
+        if dirty and op != ord('V'):
+            self.memwrites += 1
+
+    # a flush of an L1 writes its dirty lines into an inclusive L2, or to memory
+    def flush(self, source):
+        for key in self.l1[source].flush():
+            if self.inclusive:
+                self.l2writes += 1
+                self.l2allocate(key >> self.shift, True)
+            else:
+                self.memwrites += 1
+
+# Merges the D$ and I$ logs into one stream of records for a Hierarchy. The logs
+# carry no timestamps, so the n-th test (the records after the n-th BEGIN/TRAIN
+# marker) of one log is paired with the n-th test of the other, and the records of
+# each are spread evenly over the test by their position within it.
+# Returns the ops, addresses, and sources (the index of the log) of the merged records.
+def interleave(traces):
+    segments, positions = [], []
+    for trace in traces:
+        segment = np.cumsum(np.isin(trace.op, np.frombuffer(b'BT', dtype=np.uint8)))
+        length = np.bincount(segment)
+        start = np.cumsum(length) - length
+        segments.append(segment)
+        positions.append((np.arange(len(segment)) - start[segment])/length[segment])
+    sources = np.concatenate([np.full(len(trace.op), source, dtype=np.uint8) for source, trace in enumerate(traces)])
+    order = np.lexsort((sources, np.concatenate(positions), np.concatenate(segments)))
+    ops = np.concatenate([trace.op for trace in traces])[order]
+    addrs = np.concatenate([trace.addr for trace in traces])[order]
+    return ops, addrs, sources[order]
+
+# Prefetchers of a PrefetchCache. A prefetcher works on line keys (addresses shifted
+# right by the offset) and only sees the demand accesses: observe() is told whether
+# each one missed, or was the first use of a prefetched line, and returns the keys
+# of the lines to prefetch. The PrefetchCache drops keys outside the page of the
+# access and lines that are already cached or on their way.
+# Prefetchers that hold their lines in buffers beside the cache set buffered, and
+# the cache offers them each miss with take() and gives them its lines with insert().
+class Prefetcher:
+    buffered = False
+
+    def __init__(self, degree=2, entries=8, pagelines=64):
+        self.degree = degree
+        self.entries = entries
+        self.pagelines = pagelines
+
+    def reset(self):
+        pass
+
+    def observe(self, key, miss, prefetched):
+        return ()
+
+    # returns the time a buffered line arrives, taking it out of the buffers,
+    # or None if no buffer holds it
+    def take(self, key):
+        return None
+
+    def holds(self, key):
+        return False
+
+    def insert(self, key, ready):
+        pass
+
+class NextLine(Prefetcher):
+    # Prefetches the next degree lines after each miss and after the first use of a
+    # line it prefetched (tagged prefetching), so it keeps ahead of a sequential stream.
+    def observe(self, key, miss, prefetched):
+        if miss or prefetched:
+            return range(key + 1, key + 1 + self.degree)
+        return ()
+
+class Stride(Prefetcher):
+    # Finds constant strides without the PC: it remembers the last line missed on (or
+    # prefetched and used) in each of the entries most recently used pages, and once
+    # two such lines in a row of a page are the same stride apart, prefetches the
+    # next degree lines along the stride.
+    def __init__(self, degree=2, entries=8, pagelines=64):
+        super().__init__(degree, entries, pagelines)
+        self.pages = OrderedDict() # page: (last key, stride)
+
+    def reset(self):
+        self.pages.clear()
+
+    def observe(self, key, miss, prefetched):
+        if not (miss or prefetched):
+            return ()
+        page = key // self.pagelines
+        last, stride = self.pages.pop(page, (key, 0))
+        prefetches = ()
+        if key != last:
+            if key - last == stride:
+                prefetches = range(key + stride, key + stride*(self.degree + 1), stride)
+            stride = key - last
+        self.pages[page] = (key, stride)
+        if len(self.pages) > self.entries:
+            self.pages.popitem(last=False)
+        return prefetches
+
+class StreamBuffers(Prefetcher):
+    # Stream buffers (Jouppi, ISCA 1990): entries FIFOs of up to degree lines beside the
+    # cache. A miss on a line in a buffer takes it into the cache, drops the lines ahead
+    # of it, and tops the buffer up with the lines that follow; a miss on a line in no
+    # buffer restarts the least recently used buffer at the line after it.
+    buffered = True
+
+    def __init__(self, degree=2, entries=8, pagelines=64):
+        super().__init__(degree, entries, pagelines)
+        self.reset()
+
+    def reset(self):
+        self.buffers = [deque() for buffer in range(self.entries)] # (key, ready) of each line
+        self.next = [0]*self.entries # the key each buffer fetches next
+        self.order = list(range(self.entries)) # least recently used first
+        self.current = 0
+
+    def use(self, buffer):
+        self.order.remove(buffer)
+        self.order.append(buffer)
+        self.current = buffer
+
+    def take(self, key):
+        for buffer, lines in enumerate(self.buffers):
+            for position, (linekey, ready) in enumerate(lines):
+                if linekey == key:
+                    for dropped in range(position + 1):
+                        lines.popleft()
+                    self.use(buffer)
+                    return ready
+        return None
+
+    def observe(self, key, miss, prefetched):
+        if miss:
+            self.use(self.order[0])
+            self.buffers[self.current].clear()
+            self.next[self.current] = key + 1
+        elif not prefetched:
+            return ()
+        start = self.next[self.current]
+        self.next[self.current] += self.degree - len(self.buffers[self.current])
+        return range(start, self.next[self.current])
+
+    def holds(self, key):
+        return any(linekey == key for lines in self.buffers for linekey, ready in lines)
+
+    def insert(self, key, ready):
+        self.buffers[self.current].append((key, ready))
+
+PREFETCHERS = {'nextline': NextLine, 'stride': Stride, 'stream': StreamBuffers}
+PAGEBYTES = 4096 # prefetches do not cross pages, whose physical successors are unrelated
+
+class PrefetchCache:
+    # A write-back cache with a prefetcher, replaying a log with no timing: time is
+    # counted in demand accesses, and a prefetch arrives latency accesses after it is
+    # issued. A prefetch is useful if its line is used before it leaves the cache (or
+    # its buffer), and late if that use comes before it arrives; a late prefetch still
+    # counts as a hit, since it hides part of the miss. Each prefetch or demand miss
+    # reads a line from the next level, counted in fills.
+    def __init__(self, geometry, prefetcher=None, latency=20, policy='plru', seed=1):
+        self.cache = LineCache(*geometry, policy, seed)
+        self.prefetcher = prefetcher or Prefetcher()
+        self.latency = latency
+        self.pagelines = max(PAGEBYTES >> self.cache.offsetlen, 1)
+        self.pending = {} # prefetched lines in the cache and not used yet: time they arrive
+        self.now = 0
+        self.issued = 0
+        self.useful = 0
+        self.late = 0
+        self.fills = 0
+
+    def replay(self, ops, addrs):
+        accessops, writeops = set(ACCESSOPS), set(WRITEOPS)
+        F, I, B, T, C = ord('F'), ord('I'), ord('B'), ord('T'), ord('C')
+        cache, offsetlen = self.cache, self.cache.offsetlen
+        for op, addr in zip(ops, addrs):
+            if op in accessops:
+                self.access(addr >> offsetlen, op in writeops)
+            elif op == C:
+                cache.clean(addr >> offsetlen)
+            elif op in CBOOPS: # cbo.inval and cbo.flush
+                cache.remove(addr >> offsetlen)
+                self.pending.pop(addr >> offsetlen, None)
+            elif op == F:
+                cache.flush()
+            elif op == I or op == B or op == T:
+                cache.invalidate(reset=op != I)
+                self.pending.clear()
+                self.prefetcher.reset()
+
+    def access(self, key, write):
+        cache = self.cache
+        self.now += 1
+        cache.accesses += 1
+        miss = False
+        if cache.lookup(key, write):
+            ready = self.pending.pop(key, None)
+        else:
+            ready = self.prefetcher.take(key)
+            miss = ready is None
+            if miss:
+                cache.misses += 1
+                self.fills += 1
+            self.allocate(key, write)
+        if ready is not None:
+            self.useful += 1
+            self.late += ready > self.now
+        for prefetchkey in self.prefetcher.observe(key, miss, ready is not None):
+            self.prefetch(prefetchkey, key)
+
+    def allocate(self, key, dirty):
+        evicted = self.cache.allocate(key, dirty)
+        if evicted is not None:
+            self.pending.pop(evicted[0], None)
+
+    def prefetch(self, key, trigger):
+        if key // self.pagelines != trigger // self.pagelines or key in self.cache.where or self.prefetcher.holds(key):
+            return
+        self.issued += 1
+        self.fills += 1
+        if self.prefetcher.buffered:
+            self.prefetcher.insert(key, self.now + self.latency)
+        else:
+            self.allocate(key, False)
+            self.pending[key] = self.now + self.latency
+
+# parses a sweep geometry of the form SETSxWAYSxLINEBYTES
+def geometry(text):
+    try:
+        numsets, numways, linebytes = (int(field) for field in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{text} is not of the form SETSxWAYSxLINEBYTES") from None
+    for field in (numsets, numways, linebytes):
+        if field < 1 or field & (field - 1):
+            raise argparse.ArgumentTypeError(f"{text}: sets, ways, and line bytes must be powers of 2")
+    return numsets, numways, linebytes
+
+# replays each parsed chunk of a trace through every geometry and policy as it
+# arrives and returns a row of counts for each combination
+# The remaining keyword arguments (seed, writethrough, ...) are passed to ArrayCache.
+def sweep(traces, geometries, addrlen, policies=('plru',), **options):
+    caches = []
+    configs = [(geometry, policy) for geometry in geometries for policy in policies]
+    for (numsets, numways, linebytes), policy in configs:
+        taglen = addrlen - int(math.log(numsets, 2)) - int(math.log(linebytes, 2))
+        caches.append(ArrayCache(numsets, numways, addrlen, taglen, policy, **options))
+    counts = np.zeros((len(caches), 256), dtype=np.int64)
+    traffic = [Counter() for cache in caches]
+    for trace in traces:
+        isaccess = np.isin(trace.op, np.frombuffer(ACCESSOPS, dtype=np.uint8))
+        for cache, count, bytecount in zip(caches, counts, traffic):
+            count += np.bincount(cache.replay(trace)[isaccess], minlength=256)
+            bytecount.update(cache.traffic)
+    rows = []
+    for ((numsets, numways, linebytes), policy), count, bytecount in zip(configs, counts, traffic):
+        rows.append({'sets': numsets, 'ways': numways, 'linebytes': linebytes, 'policy': policy,
+                     'accesses': int(count[list(b'HMED')].sum()), 'hits': int(count[ord('H')]),
+                     'misses': int(count[list(b'MED')].sum()), 'evictions': int(count[list(b'ED')].sum()),
+                     'writebacks': int(count[ord('D')]),
+                     'readbytes': bytecount['fill'],
+                     'writebytes': bytecount['writeback'] + bytecount['flush'] + bytecount['store']})
+    return rows
+
+# Computes the LRU stack distance of every access within its set (Mattson et al.):
+# the number of distinct lines of the same set touched since the previous access
+# to the same line. An access with distance d hits in any LRU cache with more than
+# d ways, so one pass gives the miss rate of every associativity.
+# Returns, for each number of sets, a histogram per set with bins 0..maxways-1 for
+# the distances, bin maxways for larger distances, and bin maxways+1 for accesses
+# that miss in any cache because the line was never loaded or was invalidated.
+# Invalidating the whole cache is modeled exactly. A cbo that invalidates a single
+# line just removes it from the stack, which slightly overstates the hits of the
+# lines below it until the hole it leaves in the cache is refilled.
+def stackdistance(trace, setcounts, offsetlen, linebits, maxways):
+    isaccess = np.isin(trace.op, np.frombuffer(ACCESSOPS, dtype=np.uint8))
+    isinval = np.isin(trace.op, np.frombuffer(b'VL', dtype=np.uint8)) # cbo.inval and cbo.flush drop the line
+    isreset = np.isin(trace.op, np.frombuffer(b'BTI', dtype=np.uint8)) # the whole cache is invalidated
+    keys = (trace.addr >> np.uint64(offsetlen)) & np.uint64((1 << linebits) - 1)
+    epoch = np.cumsum(isreset)
+
+    # back-to-back accesses to one line have distance 0 in any set mapping, so
+    # only the first access of each run takes part in the O(N log N) pass
+    follower = np.zeros(len(keys), dtype=bool)
+    if len(keys) > 1:
+        follower[1:] = isaccess[1:] & isaccess[:-1] & (keys[1:] == keys[:-1])
+    events = np.flatnonzero((isaccess & ~follower) | isinval)
+    evkeys, evaccess, evepoch = keys[events], isaccess[events], epoch[events]
+    numevents = len(events)
+
+    # previous event on the same line, found by grouping the events by line
+    byline = np.argsort(evkeys, kind='stable')
+    sameline = evkeys[byline[1:]] == evkeys[byline[:-1]]
+    prev = np.full(numevents, -1, dtype=np.int64)
+    prev[byline[1:][sameline]] = byline[:-1][sameline]
+    cold = (prev < 0) | (evepoch[prev] != evepoch) | ~evaccess[prev]
+
+    histograms = {}
+    for numsets in setcounts:
+        sets = (evkeys & np.uint64(numsets - 1)).astype(np.int64)
+        # Ordering the events by set puts the events of a set that happen between
+        # two accesses to one line in a contiguous range, so a Fenwick tree over
+        # that order, holding a 1 at the latest event of each line, counts the
+        # distinct lines in between with two prefix sums.
+        pos = np.empty(numevents, dtype=np.int64)
+        pos[np.argsort(sets, kind='stable')] = np.arange(1, numevents + 1)
+        distances = stackpass(pos.tolist(), prev.tolist(), cold.tolist(), evaccess.tolist())
+
+        histogram = np.zeros((numsets, maxways + 2), dtype=np.int64)
+        bins = np.minimum(np.array(distances, dtype=np.int64), maxways)
+        bins[cold] = maxways + 1
+        np.add.at(histogram, (sets[evaccess], bins[evaccess]), 1)
+        followersets = (keys[follower] & np.uint64(numsets - 1)).astype(np.int64)
+        np.add.at(histogram, (followersets, 0), 1)
+        histograms[numsets] = histogram
+    return histograms
+
+def stackpass(pos, prev, cold, isaccess):
+    # Fenwick tree over positions 1..2^k, so that the update paths from any two
+    # positions meet at or below the root and can stop there
+    size = 1
+    while size < len(pos):
+        size *= 2
+    tree = [0]*(size + 1)
+    distances = [0]*len(pos)
+    for i, here in enumerate(pos):
+        last = prev[i]
+        if last >= 0 and isaccess[last] and isaccess[i]:
+            last = pos[last]
+            if not cold[i]:
+                # prefix(here-1) - prefix(last); the two walks share their tail
+                count = 0
+                a, b = here - 1, last
+                while a != b:
+                    if a > b:
+                        count += tree[a]
+                        a &= a - 1
+                    else:
+                        count -= tree[b]
+                        b &= b - 1
+                distances[i] = count
+            # move the line's marker from its previous access to this one
+            a, b = last, here
+            while a != b:
+                if a < b:
+                    tree[a] -= 1
+                    a += a & -a
+                else:
+                    tree[b] += 1
+                    b += b & -b
+        elif last >= 0 and isaccess[last]:
+            # a cbo invalidate drops the line's marker
+            last = pos[last]
+            while last <= size:
+                tree[last] -= 1
+                last += last & -last
+        elif isaccess[i]:
+            while here <= size:
+                tree[here] += 1
+                here += here & -here
+    return distances
+
+# Address maps list the start address of each function (and other symbol) of a
+# program, one hex address per line, with the names in the same order in the .lab
+# file next to the .addr file. testbench/common/functionName.sv reads the same files.
+def readaddrmap(addrfile):
+    labfile = (addrfile[:-len('.addr')] if addrfile.endswith('.addr') else addrfile) + '.lab'
+    with open(os.path.expanduser(addrfile)) as f:
+        addrs = np.array([int(line, 16) for line in f if line.strip()], dtype=np.uint64)
+    with open(os.path.expanduser(labfile)) as f:
+        labels = [line.strip() for line in f if line.strip()]
+    order = np.argsort(addrs, kind='stable')
+    return addrs[order], [labels[i] for i in order]
+
+# The loggers name the memfile of the test after each BEGIN, and the address map of
+# the test sits next to it. Returns the names in a block of a log in order.
+BEGINNAME = re.compile(rb'^BEGIN\S*[^\S\n]*(\S*)', re.MULTILINE)
+def beginnames(data):
+    return [name.decode() for name in BEGINNAME.findall(data)]
+
+def testaddrmap(memfile):
+    addrfile = (memfile[:-len('.memfile')] if memfile.endswith('.memfile') else memfile) + '.objdump.addr'
+    return readaddrmap(addrfile) if os.path.exists(addrfile) else None
+
+# Replays a log once and counts the accesses and misses of each set, line, region
+# of regionbytes, and function or other symbol containing the address, where an
+# address map is known: addrmap for the whole log, or else each test's own map,
+# which binary traces do not name.
+def attributemisses(filename, cache, regionbytes, addrmap=None):
+    names = []
+    maps = {}
+    sets = np.zeros((3, cache.numsets), dtype=np.int64) # accesses, misses, evictions
+    lines, regions, symbols = Counter(), Counter(), Counter()
+    regionaccesses, symbolaccesses = Counter(), Counter()
+    begins = 0
+    for trace in readchunks(filename, names=None if addrmap else names):
+        results = cache.replay(trace)
+        isaccess = np.isin(trace.op, np.frombuffer(ACCESSOPS, dtype=np.uint8))
+        ismiss = isaccess & (results != ord('H'))
+        _, setnums, _ = cache.splitaddrs(trace.addr)
+        setnums = setnums.astype(np.int64)
+        for row, selected in enumerate((isaccess, ismiss, np.isin(results, np.frombuffer(b'ED', dtype=np.uint8)))):
+            sets[row] += np.bincount(setnums[selected], minlength=cache.numsets)
+        lines.update(countvalues((trace.addr[ismiss] >> np.uint64(cache.offsetlen)) << np.uint64(cache.offsetlen)))
+        regions.update(countvalues(trace.addr[ismiss] // np.uint64(regionbytes)))
+        regionaccesses.update(countvalues(trace.addr[isaccess] // np.uint64(regionbytes)))
+
+        # the test each record belongs to, numbered by the BEGIN markers seen so far
+        tests = begins + np.cumsum(trace.op == ord('B'))
+        begins = int(tests[-1]) if len(tests) else begins
+        for test in np.unique(tests[isaccess]).tolist():
+            if addrmap is None and 0 < test <= len(names) and names[test - 1] not in maps:
+                maps[names[test - 1]] = testaddrmap(names[test - 1])
+            testmap = addrmap or (maps[names[test - 1]] if 0 < test <= len(names) else None)
+            if testmap is None:
+                continue
+            symboladdrs, labels = testmap
+            labels = labels + ['(before the first symbol)']
+            selected = isaccess & (tests == test)
+            # the symbol at or below each address; -1, before the first, picks the last label
+            index = np.searchsorted(symboladdrs, trace.addr[selected], side='right') - 1
+            symbolaccesses.update({labels[i]: count for i, count in countvalues(index).items()})
+            symbols.update({labels[i]: count for i, count in countvalues(index[ismiss[selected]]).items()})
+    return sets, (lines, None), (regions, regionaccesses), (symbols, symbolaccesses)
+
+# the number of times each value occurs in an array, as a dict
+def countvalues(values):
+    unique, counts = np.unique(values, return_counts=True)
+    return dict(zip(unique.tolist(), counts.tolist()))
+
 def parseArgs():
     parser = argparse.ArgumentParser(description="Simulates a L1 cache.")
     parser.add_argument('numlines', type=int, help="The number of lines per way (a power of 2)", metavar="L")
@@ -213,11 +1706,356 @@ def parseArgs():
     parser.add_argument('-v', "--verbose", action='store_true', help="verbose/full-trace mode")
     parser.add_argument('-p', "--perf", action='store_true', help="Report hit/miss ratio")
     parser.add_argument('-d', "--dist", action='store_true', help="Report distribution of operations")
+    parser.add_argument('-e', "--engine", choices=["python", "numpy"], default="python", help="Simulation engine")
+    parser.add_argument('-j', "--jobs", type=int, default=1, help="Replay the tests in the log on this many processes (numpy engine)")
+    parser.add_argument("--sweep", type=geometry, nargs='+', metavar="SETSxWAYSxLINEBYTES", help="Report hits, misses, and writebacks for each geometry")
+    parser.add_argument("--policy", choices=POLICIES, nargs='+', default=["plru"], help="Replacement policies to simulate (only plru is checked against Wally)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the random replacement policy")
+    parser.add_argument("--stack-distance", type=int, nargs='*', metavar="SETS", help="Report LRU miss rate versus ways for each number of sets")
+    parser.add_argument("--write-through", action='store_true', help="Simulate a write-through cache (Wally's caches are write-back)")
+    parser.add_argument("--no-write-allocate", action='store_true', help="Do not allocate a line on a write miss")
+    parser.add_argument("--word-bytes", type=int, default=8, help="Bytes written to the next level by each write-through or bypassing store")
+    parser.add_argument("--l2", type=geometry, metavar="SETSxWAYSxLINEBYTES", help="Replay the log (and --icache-log) through L1s and a shared L2 of this geometry")
+    parser.add_argument("--inclusion", choices=["inclusive", "exclusive"], default="inclusive", help="Inclusion policy of the L2")
+    parser.add_argument("--icache-log", help="I$ log replayed alongside the D$ log given by -f in --l2 mode")
+    parser.add_argument("--latency", type=int, nargs=3, default=[1, 10, 100], metavar=("L1", "L2", "MEM"), help="Access times in cycles used for the average memory access time")
+    parser.add_argument("--checkpoint", metavar="SNAPSHOT", help="Save the state of the replay to this file periodically (numpy engine)")
+    parser.add_argument("--checkpoint-interval", type=int, default=10000000, metavar="RECORDS", help="Records of the log replayed between snapshots")
+    parser.add_argument("--resume", nargs='?', const='', metavar="SNAPSHOT", help="Continue from a snapshot (by default the --checkpoint file)")
+    parser.add_argument("--limit", type=int, metavar="RECORDS", help="Stop after replaying this many records of the log")
+    parser.add_argument("--stop-on-mismatch", action='store_true', help="Stop at the first mismatch")
+    parser.add_argument("--miss-report", type=int, nargs='?', const=10, metavar="N", help="Report the N sets, lines, regions, and functions with the most misses")
+    parser.add_argument("--region-bytes", type=int, default=4096, help="Size of the regions of --miss-report")
+    parser.add_argument("--addr-map", metavar="FILE.addr", help="Address map for --miss-report (by default each test's own, found from its BEGIN line)")
+    parser.add_argument("--prefetch", choices=["none", *PREFETCHERS], nargs='+', help="Compare these prefetchers with the cache alone")
+    parser.add_argument("--prefetch-degree", type=int, default=2, help="Lines each prefetch fetches ahead (the depth of each stream buffer)")
+    parser.add_argument("--prefetch-entries", type=int, default=8, help="Pages the stride prefetcher tracks, or the number of stream buffers")
+    parser.add_argument("--prefetch-latency", type=int, default=20, metavar="ACCESSES", help="Accesses of the log a prefetch takes to arrive")
+    parser.add_argument('-t', "--traffic", action='store_true', help="Report the bytes read from and written to the next level (numpy engine)")
     return parser.parse_args()
 
+def mainstackdistance(args):
+    if np is None:
+        print("Error: --stack-distance requires NumPy (pip install numpy)")
+        return 1
+    setlen = int(math.log(args.numlines, 2))
+    offsetlen = args.addrlen - args.taglen - setlen
+    setcounts = args.stack_distance or [1 << n for n in range(setlen + 1)]
+    maxways = 4*args.numways
+    wayslist = [1 << n for n in range(int(math.log(maxways, 2)) + 1)]
+    trace = readlog(args.file)
+    histograms = stackdistance(trace, setcounts, offsetlen, args.taglen + setlen, maxways)
+
+    print(f"True LRU miss rate by number of ways with {1 << offsetlen}-byte lines")
+    print(f"{'Sets':>6}" + "".join(f"{ways:>8}" for ways in wayslist))
+    for numsets in setcounts:
+        counts = histograms[numsets].sum(axis=0)
+        accesses = counts.sum()
+        # with W ways, every access with a distance of W or more misses
+        missrates = [counts[ways:].sum()/accesses if accesses else 0 for ways in wayslist]
+        print(f"{numsets:>6}" + "".join(f"{missrate:>8.2%}" for missrate in missrates))
+
+    if args.verbose:
+        for numsets in setcounts:
+            print(f"\nReuse distance histograms for {numsets} sets (distances 0-{maxways-1}, >={maxways}, compulsory/invalidated)")
+            for setnum, histogram in enumerate(histograms[numsets]):
+                print(f"{setnum:>6}: " + " ".join(str(count) for count in histogram))
+    return 0
+
+def mainsweep(args):
+    if np is None:
+        print("Error: --sweep and --policy require NumPy (pip install numpy)")
+        return 1
+    # without --sweep, compare the policies on the geometry given by L, W, A, and T
+    geometries = args.sweep or [(args.numlines, args.numways, 1 << (args.addrlen - args.taglen - int(math.log(args.numlines, 2))))]
+    rows = sweep(readchunks(args.file), geometries, args.addrlen, args.policy, seed=args.seed,
+                 writethrough=args.write_through, writeallocate=not args.no_write_allocate, wordbytes=args.word_bytes)
+    header = f"{'Sets':>6} {'Ways':>4} {'Line':>5} {'KiB':>6} {'Policy':>6} {'Accesses':>10} {'Hits':>10} {'Misses':>10} {'Writebacks':>10} {'Miss rate':>9}"
+    if args.traffic:
+        header += f" {'Read B':>12} {'Written B':>12} {'B/access':>8}"
+    print(header)
+    for row in rows:
+        kib = row['sets']*row['ways']*row['linebytes']/1024
+        missrate = row['misses']/row['accesses'] if row['accesses'] else 0
+        line = f"{row['sets']:>6} {row['ways']:>4} {row['linebytes']:>5} {kib:>6g} {row['policy']:>6} {row['accesses']:>10} {row['hits']:>10} {row['misses']:>10} {row['writebacks']:>10} {missrate:>9.2%}"
+        if args.traffic:
+            bytesperaccess = (row['readbytes'] + row['writebytes'])/row['accesses'] if row['accesses'] else 0
+            line += f" {row['readbytes']:>12} {row['writebytes']:>12} {bytesperaccess:>8.2f}"
+        print(line)
+    return 0
+
+def mainmissreport(args):
+    if np is None:
+        print("Error: --miss-report requires NumPy (pip install numpy)")
+        return 1
+    cache = ArrayCache(args.numlines, args.numways, args.addrlen, args.taglen)
+    sets, lines, regions, symbols = attributemisses(args.file, cache, args.region_bytes,
+                                                    readaddrmap(args.addr_map) if args.addr_map else None)
+    accesses, misses, evictions = sets.sum(axis=1)
+    print(f"{accesses} accesses, {misses} misses ({misses/accesses if accesses else 0:.2%}), {evictions} evictions")
+
+    # Evictions are the misses that displaced a valid line, so sets with many more
+    # evictions than the rest are losing capacity to conflicts.
+    print(f"\nMisses per set: min {sets[1].min()}, mean {sets[1].mean():.1f}, max {sets[1].max()}; "
+          f"evictions per set: min {sets[2].min()}, mean {sets[2].mean():.1f}, max {sets[2].max()}")
+    print(f"{'Set':>6} {'Accesses':>10} {'Misses':>10} {'Evictions':>10} {'Miss rate':>9}")
+    order = np.argsort(-sets[2], kind='stable')
+    for setnum in (order if args.verbose else order[:args.miss_report]).tolist():
+        print(f"{setnum:>6} {sets[0][setnum]:>10} {sets[1][setnum]:>10} {sets[2][setnum]:>10} {sets[1][setnum]/sets[0][setnum] if sets[0][setnum] else 0:>9.2%}")
+
+    for title, (counts, totals), label in (("lines", lines, lambda line: f"{line:x}"),
+                                           (f"{args.region_bytes}-byte regions", regions, lambda region: f"{region*args.region_bytes:x}"),
+                                           ("functions", symbols, str)):
+        if not counts and title == "functions":
+            print("\nNo address map found for the functions (see --addr-map)")
+            continue
+        print(f"\nTop {args.miss_report} {title} by misses")
+        for key, count in counts.most_common(args.miss_report):
+            share = f" of {totals[key]} accesses ({count/totals[key]:.2%})" if totals else ""
+            print(f"{label(key):>24} {count:>10} misses{share}")
+    return 0
+
+def mainprefetch(args):
+    if np is None:
+        print("Error: --prefetch requires NumPy (pip install numpy)")
+        return 1
+    linebytes = 1 << (args.addrlen - args.taglen - int(math.log(args.numlines, 2)))
+    geometry = (args.numlines, args.numways, linebytes)
+    pagelines = max(PAGEBYTES // linebytes, 1)
+    names = ["none"] + [name for name in args.prefetch if name != "none"]
+    caches = [PrefetchCache(geometry, PREFETCHERS[name](args.prefetch_degree, args.prefetch_entries, pagelines) if name != "none" else None,
+                            args.prefetch_latency, args.policy[0], args.seed) for name in names]
+    for trace in readchunks(args.file):
+        ops, addrs = trace.op.tolist(), trace.addr.tolist()
+        for cache in caches:
+            cache.replay(ops, addrs)
+
+    # Coverage is the share of the misses the prefetcher removed, counting each useful
+    # prefetch as a removed miss; accuracy is the share of the prefetches that were
+    # useful, and lateness the share of the useful prefetches that arrived late. The
+    # extra traffic is the line reads beyond those of the cache without a prefetcher.
+    def share(count, total):
+        return count/total if total else 0
+    print(f"{'Prefetcher':<10} {'Accesses':>10} {'Misses':>10} {'Miss rate':>9} {'Prefetches':>10} {'Useful':>10} {'Late':>10} "
+          f"{'Coverage':>8} {'Accuracy':>8} {'Lateness':>8} {'Read bytes':>12} {'Extra':>8}")
+    basefills = caches[0].fills
+    for name, cache in zip(names, caches):
+        accesses, misses = cache.cache.accesses, cache.cache.misses
+        print(f"{name:<10} {accesses:>10} {misses:>10} {share(misses, accesses):>9.2%} {cache.issued:>10} {cache.useful:>10} {cache.late:>10} "
+              f"{share(cache.useful, cache.useful + misses):>8.2%} {share(cache.useful, cache.issued):>8.2%} {share(cache.late, cache.useful):>8.2%} "
+              f"{cache.fills*linebytes:>12} {share(cache.fills - basefills, basefills):>+8.2%}")
+    return 0
+
+def mainhierarchy(args):
+    if np is None:
+        print("Error: --l2 requires NumPy (pip install numpy)")
+        return 1
+    l1linebytes = 1 << (args.addrlen - args.taglen - int(math.log(args.numlines, 2)))
+    if args.l2[2] < l1linebytes or (args.inclusion == "exclusive" and args.l2[2] != l1linebytes):
+        print(f"Error: {args.inclusion} L2 lines cannot be {args.l2[2]} bytes with {l1linebytes}-byte L1 lines")
+        return 1
+    logs = [args.file] + ([args.icache_log] if args.icache_log else [])
+    ops, addrs, sources = interleave([readlog(log) for log in logs])
+    hierarchy = Hierarchy((args.numlines, args.numways, l1linebytes), args.l2,
+                          args.inclusion == "inclusive", args.policy[0], args.seed)
+    hierarchy.replay(ops.tolist(), addrs.tolist(), sources.tolist())
+
+    # The average memory access time of a level is its access time plus the time its
+    # misses spend in the levels behind it, averaged over its accesses. The All row
+    # counts the accesses that missed in both levels, against all L1 accesses.
+    l1time, l2time, memtime = args.latency
+    def average(total, count):
+        return total/count if count else 0
+    l1, l2 = hierarchy.l1, hierarchy.l2
+    rows = [('L1 D$', l1[0].accesses, l1[0].misses, l1time + average(l1[0].misses*l2time + hierarchy.farmisses[0]*memtime, l1[0].accesses))]
+    if args.icache_log:
+        rows.append(('L1 I$', l1[1].accesses, l1[1].misses, l1time + average(l1[1].misses*l2time + hierarchy.farmisses[1]*memtime, l1[1].accesses)))
+    rows.append(('L2', l2.accesses, l2.misses, l2time + average(l2.misses*memtime, l2.accesses)))
+    accesses = l1[0].accesses + l1[1].accesses
+    rows.append(('All', accesses, l2.misses, l1time + average(l2.accesses*l2time + l2.misses*memtime, accesses)))
+    print(f"{'Level':<6} {'Accesses':>10} {'Misses':>10} {'Miss rate':>9} {'AMAT':>8}")
+    for name, accesses, misses, time in rows:
+        print(f"{name:<6} {accesses:>10} {misses:>10} {average(misses, accesses):>9.2%} {time:>8.2f}")
+    if args.inclusion == "inclusive":
+        print(f"The L1s wrote {hierarchy.l2writes} lines back into the L2, and the L2 invalidated {hierarchy.backinvalidations} L1 lines to stay inclusive.")
+    else:
+        print(f"The L1s evicted {hierarchy.l2writes} lines into the L2.")
+    print(f"Memory served {hierarchy.memreads} line reads ({hierarchy.memreads*args.l2[2]} bytes) and {hierarchy.memwrites} line writes ({hierarchy.memwrites*args.l2[2]} bytes).")
+    return 0
+
+# counts the outcomes of a replayed trace, and the next-level traffic of the
+# cache that replayed it, and formats its mismatches
+def tally(trace, results, traffic):
+    isaccess = np.isin(trace.op, np.frombuffer(ACCESSOPS, dtype=np.uint8))
+    ismismatch = isaccess & (results != trace.result)
+    messages = [f"Result mismatch at address {int(trace.addr[i]):0{trace.width[i]}x}. Wally: {chr(trace.result[i])}, Sim: {chr(results[i])}"
+                for i in np.flatnonzero(ismismatch)]
+    counts = Counter(mismatches=int(np.count_nonzero(ismismatch)),
+                     hits=int(np.count_nonzero(isaccess & (results == ord('H')))),
+                     accesses=int(np.count_nonzero(isaccess)),
+                     loads=int(np.count_nonzero(trace.op == ord('R'))),
+                     stores=int(np.count_nonzero(trace.op == ord('W'))),
+                     atoms=int(np.count_nonzero(trace.op == ord('A'))),
+                     totalops=int(np.count_nonzero(~np.isin(trace.op, np.frombuffer(b'BTE', dtype=np.uint8)))))
+    counts.update({category + 'bytes': count for category, count in traffic.items()})
+    return counts, messages
+
+# replays whole tests on an empty cache in a worker process
+def replayjob(geometry, trace):
+    cache = ArrayCache(*geometry)
+    return tally(trace, cache.replay(trace), cache.traffic)
+
+# replays the log on --jobs processes, yielding the tallies in log order
+def replayparallel(args):
+    geometry = (args.numlines, args.numways, args.addrlen, args.taglen)
+    with Pool(processes=args.jobs) as pool:
+        pending = deque()
+        for trace, mode in splitjobs(readchunks(args.file)):
+            if mode == 'job':
+                pending.append(pool.apply_async(replayjob, (geometry, trace)))
+            else: # a long test is replayed here while the workers carry on
+                if mode == 'first':
+                    cache = ArrayCache(*geometry)
+                pending.append(tally(trace, cache.replay(trace), cache.traffic))
+            # a bounded number of jobs in flight keeps memory bounded
+            while pending and (len(pending) > 2*args.jobs or not isinstance(pending[0], AsyncResult) or pending[0].ready()):
+                item = pending.popleft()
+                yield item.get() if isinstance(item, AsyncResult) else item
+        for item in pending:
+            yield item.get() if isinstance(item, AsyncResult) else item
+
+# Snapshots of a replay in progress hold the cache state, the offset in the
+# uncompressed log of the next record, and the counts so far, so that a long
+# replay can be resumed, or a region of a log replayed on a warm cache.
+SNAPSHOTVERSION = 1
+
+# writes a snapshot through a temporary file, so that a crash while writing
+# leaves the previous snapshot intact
+def savesnapshot(filename, cache, logfile, offset, counts):
+    filename = os.path.expanduser(filename)
+    with open(filename + '.tmp', 'wb') as f:
+        np.savez(f, version=SNAPSHOTVERSION, geometry=[cache.numsets, cache.numways, cache.addrlen, cache.taglen],
+                 policyname=type(cache.policy).__name__, logsize=os.path.getsize(os.path.expanduser(logfile)),
+                 offset=offset, tags=cache.tags, valid=cache.valid, dirty=cache.dirty, policy=cache.policy.state,
+                 countnames=np.array(list(counts), dtype=str), counts=np.array(list(counts.values()), dtype=np.int64))
+    os.replace(filename + '.tmp', filename)
+
+# restores the cache state of a snapshot and returns its offset and counts
+def loadsnapshot(filename, cache, logfile):
+    try:
+        snapshot = np.load(os.path.expanduser(filename))
+    except (OSError, ValueError) as e:
+        sys.exit(f"Error: cannot read snapshot {filename}: {e}")
+    with snapshot:
+        if (int(snapshot['version']) != SNAPSHOTVERSION or str(snapshot['policyname']) != type(cache.policy).__name__
+                or snapshot['geometry'].tolist() != [cache.numsets, cache.numways, cache.addrlen, cache.taglen]):
+            sys.exit(f"Error: snapshot {filename} was taken with a different cache configuration")
+        if int(snapshot['logsize']) != os.path.getsize(os.path.expanduser(logfile)):
+            sys.exit(f"Error: snapshot {filename} was taken from a different log")
+        cache.tags[:] = snapshot['tags']
+        cache.valid[:] = snapshot['valid']
+        cache.dirty[:] = snapshot['dirty']
+        cache.policy.state[:] = snapshot['policy']
+        return int(snapshot['offset']), Counter(dict(zip(snapshot['countnames'].tolist(), snapshot['counts'].tolist())))
+
+def replayserial(args):
+    cache = ArrayCache(args.numlines, args.numways, args.addrlen, args.taglen)
+    start = 0
+    if args.resume is not None:
+        start, done = loadsnapshot(args.resume or args.checkpoint, cache, args.file)
+        yield done, [] # the counts replayed before the snapshot
+    else:
+        done = Counter()
+    remaining = args.limit
+    sincecheckpoint = 0
+    for trace, offset in readchunkoffsets(args.file, start=start):
+        if remaining is not None:
+            if remaining <= 0:
+                break
+            if len(trace.op) > remaining:
+                trace = slicetrace(trace, 0, remaining)
+                offset = None # the chunk was cut short, so no snapshot is taken after it
+            remaining -= len(trace.op)
+        results = cache.replay(trace)
+        if args.verbose:
+            isaccess = np.isin(trace.op, np.frombuffer(ACCESSOPS, dtype=np.uint8))
+            tags, setnums, offsets = cache.splitaddrs(trace.addr)
+            for i in range(len(trace.op)):
+                op = chr(trace.op[i])
+                if op == 'B' or op == 'T':
+                    print("New Test")
+                elif op == 'F' or op == 'I' or op in CBOOPS.decode():
+                    print(op)
+                elif op in ACCESSOPS.decode():
+                    print(hex(trace.addr[i]), hex(tags[i]), hex(setnums[i]), hex(offsets[i]), chr(trace.result[i]), chr(results[i]))
+                    if isaccess[i] and results[i] != trace.result[i]:
+                        print(f"Result mismatch at address {int(trace.addr[i]):0{trace.width[i]}x}. Wally: {chr(trace.result[i])}, Sim: {chr(results[i])}")
+            counts, messages = tally(trace, results, cache.traffic)[0], []
+        else:
+            counts, messages = tally(trace, results, cache.traffic)
+        yield counts, messages
+        if args.checkpoint:
+            done.update(counts)
+            sincecheckpoint += len(trace.op)
+            if sincecheckpoint >= args.checkpoint_interval and offset is not None:
+                savesnapshot(args.checkpoint, cache, args.file, offset, done)
+                sincecheckpoint = 0
+
+def mainarray(args):
+    if np is None:
+        print("Error: the numpy engine requires NumPy (pip install numpy)")
+        return 1
+    if args.resume == '' and not args.checkpoint:
+        print("Error: --resume without a snapshot needs --checkpoint")
+        return 1
+    checkpointing = args.checkpoint or args.resume is not None or args.limit is not None
+    total = Counter()
+    for counts, messages in (replayparallel(args) if args.jobs > 1 and not args.verbose and not checkpointing else replayserial(args)):
+        for message in (messages[:1] if args.stop_on_mismatch else messages):
+            print(message)
+        total += counts
+        if args.stop_on_mismatch and counts['mismatches']:
+            break
+    mismatches = total['mismatches']
+
+    if args.dist:
+        percent_loads = str(round(100*total['loads']/total['totalops']))
+        percent_stores = str(round(100*total['stores']/total['totalops']))
+        percent_atoms = str(round(100*total['atoms']/total['totalops']))
+        print(f"This log had {percent_loads}% loads, {percent_stores}% stores, and {percent_atoms}% atomic operations.")
+
+    if args.perf:
+        hits = total['hits']
+        misses = total['accesses'] - hits
+        ratio = round(hits/misses,3) if misses else ("infinite" if hits else "undefined")
+        print("There were", hits, "hits and", misses, "misses. The hit/miss ratio was", str(ratio)+".")
+
+    if args.traffic:
+        written = total['writebackbytes'] + total['flushbytes'] + total['storebytes']
+        print(f"The cache read {total['fillbytes']} bytes from the next level in line fills and wrote {written} bytes to it "
+              f"({total['writebackbytes']} in writebacks, {total['flushbytes']} in flushes).")
+
+    if mismatches == 0:
+        print("SUCCESS! There were no mismatches between Wally and the sim.")
+    return mismatches
+
 def main(args):
+    if args.l2:
+        return mainhierarchy(args)
+    if args.miss_report is not None:
+        return mainmissreport(args)
+    if args.prefetch:
+        return mainprefetch(args)
+    if args.sweep or args.policy != ["plru"] or args.write_through or args.no_write_allocate:
+        return mainsweep(args)
+    if args.stack_distance is not None:
+        return mainstackdistance(args)
+    if args.engine == "numpy" or args.traffic or args.checkpoint or args.resume is not None or args.limit is not None:
+        return mainarray(args)
+    if isbinarylog(args.file):
+        print("Error: binary traces can only be replayed with -e numpy")
+        return 1
     cache = Cache(args.numlines, args.numways, args.addrlen, args.taglen)
-    extfile = os.path.expanduser(args.file)
     mismatches = 0
 
     if args.perf:
@@ -230,7 +2068,7 @@ def main(args):
         atoms = 0
         totalops = 0
 
-    with open(extfile) as f:
+    with openlog(args.file, 'r') as f:
         for ln in f:
             ln = ln.strip()
             lninfo = ln.split()
@@ -287,6 +2125,8 @@ def main(args):
                     if result != lninfo[2]:
                         print(f"Result mismatch at address {lninfo[0]}. Wally: {lninfo[2]}, Sim: {result}")
                         mismatches += 1
+                        if args.stop_on_mismatch:
+                            break
     if args.dist:
         percent_loads = str(round(100*loads/totalops))
         percent_stores = str(round(100*stores/totalops))
@@ -294,7 +2134,7 @@ def main(args):
         print(f"This log had {percent_loads}% loads, {percent_stores}% stores, and {percent_atoms}% atomic operations.")
 
     if args.perf:
-        ratio = round(hits/misses,3)
+        ratio = round(hits/misses,3) if misses else ("infinite" if hits else "undefined")
         print("There were", hits, "hits and", misses, "misses. The hit/miss ratio was", str(ratio)+".")
 
     if mismatches == 0:
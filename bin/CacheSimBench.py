@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+###########################################
+## CacheSimBench.py
+##
+## Created: 17 October 2026
+##
+## Purpose: Measure the throughput and memory use of the CacheSim.py engines on synthetic traces
+##
+## A component of the CORE-V-WALLY configurable RISC-V project.
+## https://github.com/openhwgroup/cvw
+##
+## Copyright (C) 2021-25 Harvey Mudd College & Oklahoma State University
+##
+## SPDX-License-Identifier: Apache-2.0 WITH SHL-2.1
+##
+## Licensed under the Solderpad Hardware License v 2.1 (the “License”); you may not use this file
+## except in compliance with the License, or, at your option, the Apache License version 2.0. You
+## may obtain a copy of the License at
+##
+## https:##solderpad.org/licenses/SHL-2.1/
+##
+## Unless required by applicable law or agreed to in writing, any work distributed under the
+## License is distributed on an “AS IS” BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+## either express or implied. See the License for the specific language governing permissions
+## and limitations under the License.
+################################################################################################
+
+# how to invoke this benchmark:
+# CacheSimBench.py [-p PATTERN ...] [-w SIZE ...] [-n RECORDS] [-e ENGINE ...] [-o results.json]
+# e.g. 'CacheSimBench.py -w 4K 16K 1M -e python numpy numpy-j4 --baseline last.json'
+# Writes a log in the loggers.sv format for each access pattern and working-set size:
+#   stream       8-byte accesses walking through the working set
+#   strided      accesses --stride bytes apart, wrapping around the working set
+#   random       8-byte accesses to random places in the working set
+#   pointerchase loads following a random cycle through every line of the working set
+# A quarter of the stream, strided, and random accesses are stores. The hit/miss column
+# is filled in with the cache's own outcome, so every engine must replay it without a
+# mismatch. Each engine then replays each log in a separate process (numpy-jN runs the
+# numpy engine on N cores), and the best of --repeat wall times, the peak memory use,
+# and the accesses per second are printed and written to the JSON file. The time an
+# engine takes to start on an empty log is measured too, and the replay rate leaves it
+# out when the replay takes most of the time (raise -n for short logs).
+# --baseline compares the accesses per second with the JSON file of an earlier run.
+
+import os
+import sys
+import math
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import CacheSim
+
+cachesim = os.path.join(os.path.dirname(os.path.abspath(__file__)), "CacheSim.py")
+patterns = ["stream", "strided", "random", "pointerchase"]
+
+# parses a size in bytes with an optional K, M, or G suffix
+def size(text):
+    scale = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}.get(text[-1:].upper(), 1)
+    try:
+        return int(text[:-1] if scale > 1 else text)*scale
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{text} is not a size such as 4096, 16K, or 1M") from None
+
+# returns the addresses and ops of a synthetic access pattern over workingset bytes
+def generate(pattern, workingset, records, args):
+    np = CacheSim.np
+    rng = np.random.default_rng(args.seed)
+    linebytes = 1 << (args.addrlen - args.taglen - int(math.log(args.numlines, 2)))
+    if pattern == "stream":
+        offsets = np.arange(records, dtype=np.uint64)*8 % workingset
+    elif pattern == "strided":
+        offsets = np.arange(records, dtype=np.uint64)*args.stride % workingset
+    elif pattern == "random":
+        offsets = rng.integers(0, workingset // 8, records, dtype=np.uint64)*8
+    else:
+        # visiting the lines in the order of a random permutation follows a single cycle
+        cycle = rng.permutation(max(workingset // linebytes, 1)).astype(np.uint64)
+        offsets = cycle[np.arange(records) % len(cycle)]*linebytes
+    ops = np.full(records, ord('R'), dtype=np.uint8)
+    if pattern != "pointerchase":
+        ops[rng.random(records) < 0.25] = ord('W')
+    return np.uint64(0x80000000) + offsets, ops
+
+# writes a log of the pattern, with the outcomes the cache itself gives
+def writelog(filename, addrs, ops, args):
+    np = CacheSim.np
+    cache = CacheSim.ArrayCache(args.numlines, args.numways, args.addrlen, args.taglen)
+    trace = CacheSim.Trace(addrs, ops, np.zeros(len(ops), dtype=np.uint8), np.full(len(ops), 14, dtype=np.uint8))
+    results = cache.replay(trace)
+    with open(filename, 'w') as f:
+        f.write("BEGIN bench\n")
+        f.writelines(f"{addr:014x} {chr(op)} {chr(result)}\n" for addr, op, result in zip(addrs.tolist(), ops.tolist(), results.tolist()))
+
+def enginecommand(engine, logfile, args):
+    cmd = [sys.executable, cachesim, str(args.numlines), str(args.numways), str(args.addrlen), str(args.taglen), "-f", logfile]
+    if engine.startswith("numpy"):
+        cmd += ["-e", "numpy"]
+        if engine.startswith("numpy-j"):
+            cmd += ["-j", engine[len("numpy-j"):]]
+    return cmd
+
+# returns the peak resident memory (VmHWM) in KiB of each live process of the tree under pid
+def peakmemory(pid):
+    peaks = {}
+    pending = [pid]
+    while pending:
+        p = pending.pop()
+        try:
+            with open(f"/proc/{p}/status") as f:
+                peaks[p] = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+            for task in os.listdir(f"/proc/{p}/task"):
+                with open(f"/proc/{p}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (OSError, StopIteration, ValueError): # exited, or a zombie that no longer has memory
+            continue
+    return peaks
+
+# runs a command and returns its wall time, peak resident memory in KiB, and exit status
+# The memory is the sum of the VmHWM of the engine and of its workers (numpy-jN), which count the
+# pages they share with the engine too, read every memorypoll seconds while they run. It is not the
+# ru_maxrss of wait4, which starts from the peak of this process as the child is forked from it.
+def measure(cmd, memorypoll=0.01):
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    peaks = {}
+    while True:
+        for p, kib in peakmemory(proc.pid).items():
+            peaks[p] = max(peaks.get(p, 0), kib)
+        try:
+            proc.wait(timeout=memorypoll)
+            break
+        except subprocess.TimeoutExpired:
+            continue
+    return time.perf_counter() - start, sum(peaks.values()), proc.returncode
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description="Benchmarks the CacheSim.py engines on synthetic traces.")
+    parser.add_argument('-p', "--patterns", nargs='+', choices=patterns, default=patterns, help="Access patterns to generate")
+    parser.add_argument('-w', "--workingsets", type=size, nargs='+', default=[4 << 10, 16 << 10, 64 << 10, 1 << 20], help="Working-set sizes")
+    parser.add_argument('-n', "--records", type=int, default=200000, help="Accesses in each log")
+    parser.add_argument('-e', "--engines", nargs='+', default=["python", "numpy"], help="Engines to time: python, numpy, or numpy-jN")
+    parser.add_argument('-r', "--repeat", type=int, default=3, help="Runs of each engine on each log; the fastest counts")
+    parser.add_argument('-o', "--output", default="CacheSimBench.json", help="JSON file to write the results to")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--stride", type=int, default=192, help="Bytes between the accesses of the strided pattern")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the random and pointer-chase patterns")
+    parser.add_argument("--geometry", type=int, nargs=4, default=[64, 4, 56, 44], metavar=("L", "W", "A", "T"), help="Cache geometry, as given to CacheSim.py")
+    args = parser.parse_args()
+    args.numlines, args.numways, args.addrlen, args.taglen = args.geometry
+    return args
+
+def main(args):
+    if CacheSim.np is None:
+        print("Error: generating the traces requires NumPy (pip install numpy)")
+        return 1
+    for engine in args.engines:
+        if engine not in ("python", "numpy") and not (engine.startswith("numpy-j") and engine[len("numpy-j"):].isdigit()):
+            print(f"Error: unknown engine {engine}")
+            return 1
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            for row in json.load(f)["results"]:
+                baseline[(row["pattern"], row["workingset"], row["records"], row["engine"])] = row["accesses_per_second"]
+
+    results = []
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmpdir:
+        emptylog = os.path.join(tmpdir, "empty.log")
+        open(emptylog, 'w').close()
+        startup = {engine: min(measure(enginecommand(engine, emptylog, args))[0] for _ in range(args.repeat)) for engine in args.engines}
+        print(f"{'Pattern':<12} {'Set':>8} {'Engine':<9} {'Seconds':>8} {'Accesses/s':>12} {'Replay/s':>12} {'Max RSS':>10}" + (f" {'Speedup':>8}" if baseline else ""))
+        for pattern in args.patterns:
+            for workingset in args.workingsets:
+                logfile = os.path.join(tmpdir, f"{pattern}_{workingset}.log")
+                writelog(logfile, *generate(pattern, workingset, args.records, args), args)
+                for engine in args.engines:
+                    runs = [measure(enginecommand(engine, logfile, args)) for _ in range(args.repeat)]
+                    seconds = min(run[0] for run in runs)
+                    maxrss = max(run[1] for run in runs)
+                    ok = all(run[2] == 0 for run in runs) # any mismatch means an engine is wrong
+                    failures += not ok
+                    rate = args.records/seconds
+                    # startup noise swamps the difference when the replay itself is short
+                    replayrate = args.records/(seconds - startup[engine]) if seconds > 2*startup[engine] else None
+                    row = {"pattern": pattern, "workingset": workingset, "records": args.records, "engine": engine,
+                           "seconds": seconds, "startup_seconds": startup[engine], "accesses_per_second": rate,
+                           "replay_accesses_per_second": replayrate, "maxrss_kib": maxrss, "ok": ok}
+                    results.append(row)
+                    replay = f"{replayrate:>12.0f}" if replayrate else f"{'-':>12}"
+                    line = f"{pattern:<12} {workingset:>8} {engine:<9} {seconds:>8.3f} {rate:>12.0f} {replay} {maxrss:>7} KiB"
+                    old = baseline.get((pattern, workingset, args.records, engine))
+                    if baseline:
+                        line += f" {rate/old:>7.2f}x" if old else f" {'-':>8}"
+                    print(line + ("" if ok else "  MISMATCHES"))
+
+    with open(args.output, 'w') as f:
+        json.dump({"date": time.strftime("%Y-%m-%dT%H:%M:%S"), "host": platform.node(), "cpus": os.cpu_count(),
+                   "python": platform.python_version(), "numpy": CacheSim.np.__version__,
+                   "geometry": args.geometry, "results": results}, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+    return failures
+
+if __name__ == '__main__':
+    args = parseArgs()
+    sys.exit(main(args))
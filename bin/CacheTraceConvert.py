@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+###########################################
+## CacheTraceConvert.py
+##
+## Created: 17 October 2026
+##
+## Purpose: Convert ICache.log/DCache.log text logs to the binary trace format read by CacheSim.py
+##
+## A component of the CORE-V-WALLY configurable RISC-V project.
+## https://github.com/openhwgroup/cvw
+##
+## Copyright (C) 2021-25 Harvey Mudd College & Oklahoma State University
+##
+## SPDX-License-Identifier: Apache-2.0 WITH SHL-2.1
+##
+## Licensed under the Solderpad Hardware License v 2.1 (the “License”); you may not use this file
+## except in compliance with the License, or, at your option, the Apache License version 2.0. You
+## may obtain a copy of the License at
+##
+## https:##solderpad.org/licenses/SHL-2.1/
+##
+## Unless required by applicable law or agreed to in writing, any work distributed under the
+## License is distributed on an “AS IS” BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+## either express or implied. See the License for the specific language governing permissions
+## and limitations under the License.
+################################################################################################
+
+# how to invoke this converter:
+# CacheTraceConvert.py <text log> <binary trace>
+# e.g. 'CacheTraceConvert.py DCache.log.gz DCache.bin', then 'CacheSim.py 64 4 56 44 -f DCache.bin -e numpy'
+# The text log may be compressed with gzip or zstd. Each record of the binary trace
+# takes 10 bytes, and CacheSim.py memory-maps it instead of parsing text.
+
+import argparse
+import sys
+import CacheSim
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description="Converts a cache log to the binary trace format read by CacheSim.py.")
+    parser.add_argument('textlog', help="Text log written by loggers.sv (may be .gz or .zst)")
+    parser.add_argument('binlog', help="Binary trace to write")
+    return parser.parse_args()
+
+def main(args):
+    if CacheSim.np is None:
+        print("Error: converting logs requires NumPy (pip install numpy)")
+        return 1
+    if CacheSim.isbinarylog(args.textlog):
+        print(f"Error: {args.textlog} is already a binary trace")
+        return 1
+    records = CacheSim.writebinarylog(args.textlog, args.binlog)
+    print(f"Wrote {records} records to {args.binlog}")
+    return 0
+
+if __name__ == '__main__':
+    args = parseArgs()
+    sys.exit(main(args))
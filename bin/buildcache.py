@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+#
+# buildcache.py
+# 17 October 2026
+# Cache of compiled simulation models, named by a hash of everything that goes into them
+# usage: buildcache.py [--list] [--evict] [--clear]
+#
+# wsim (and run_vcs) look a build up here before compiling and store it after compiling, so
+# nightly, developer, and CI runs of the same tree compile each model once. The key hashes the
+# contents of the configuration, src, testbench, and ethernet addin files and of the simulator's
+# build scripts, the simulator version, and the flags that change the build.
+# The cache is in $WALLY_BUILD_CACHE (~/.cache/wally/builds by default; "off" disables it) and
+# holds up to $WALLY_BUILD_CACHE_SIZE (20G by default); the least recently used builds are
+# removed when it grows past that. Point $WALLY_BUILD_CACHE at an NFS directory to share the
+# builds between machines: entries are written under a temporary name and renamed into place,
+# which is atomic on NFS too, so no locks are needed.
+#
+# SPDX-License-Identifier: Apache-2.0 WITH SHL-2.1
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+
+# Global variables
+WALLY = os.environ.get("WALLY")
+CACHEDIR = os.environ.get("WALLY_BUILD_CACHE") or os.path.join(os.path.expanduser("~"), ".cache", "wally", "builds")
+CACHESIZE = os.environ.get("WALLY_BUILD_CACHE_SIZE", "20G")
+STALE = 24*60*60 # seconds after which an unfinished entry is abandoned
+
+# the files that describe how each simulator builds a model, besides the sources
+SIMFILES = {"verilator": ["sim/verilator/Makefile", "sim/verilator/wrapper.c", "sim/verilator/warm.cpp"],
+            "vcs": ["sim/vcs/run_vcs"],
+            "questa": ["sim/questa/wally.do"]}
+# files an `include can pull in from a directory on the include path
+VERILOGFILES = (".sv", ".svh", ".v", ".vh")
+VERSIONCMDS = {"verilator": "verilator --version", "vcs": "vcs -ID", "questa": "vsim -version"}
+
+def enabled():
+    return CACHEDIR != "off"
+
+def parseSize(text):
+    scale = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}.get(text[-1:].upper(), 1)
+    return int(text[:-1] if scale > 1 else text)*scale
+
+def sourceFiles(sim, config, extradirs=(), includedirs=()):
+    # every file of the directories a model of config is compiled from, skipping hidden ones such as .git,
+    # and the Verilog files of the other directories on the include path, which may hold much else
+    dirs = ["config/shared", f"config/{config}", f"config/deriv/{config}", "src", "testbench", "addins/verilog-ethernet", *extradirs]
+    files = [os.path.join(WALLY, f) for f in SIMFILES[sim]]
+    for d in [*dirs, *includedirs]:
+        for dirpath, dirnames, filenames in os.walk(os.path.join(WALLY, d)):
+            dirnames[:] = [dirname for dirname in dirnames if not dirname.startswith(".")]
+            files.extend(os.path.join(dirpath, f) for f in filenames
+                         if not f.startswith(".") and (d in dirs or f.endswith(VERILOGFILES)))
+    return sorted({f for f in files if os.path.isfile(f)})
+
+def simulatorVersion(sim):
+    try:
+        return subprocess.run(VERSIONCMDS[sim], shell=True, capture_output=True, text=True, timeout=120).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return ""
+
+def buildKey(sim, config, flags, extradirs=(), includedirs=()):
+    # flags holds everything else that changes the build: testbench, parameters, defines, coverage, ...
+    h = hashlib.sha256(f"{sim}\0{config}\0{' '.join(flags.split())}\0{simulatorVersion(sim)}\0".encode())
+    for source in sourceFiles(sim, config, extradirs, includedirs):
+        with open(source, "rb") as f:
+            h.update(os.path.relpath(source, WALLY).encode() + b"\0" + hashlib.sha256(f.read()).digest())
+    return h.hexdigest()[:16]
+
+def copyPath(src, dst):
+    if os.path.isdir(src) and not os.path.islink(src):
+        shutil.copytree(src, dst, symlinks=True, dirs_exist_ok=True)
+    else:
+        shutil.copy2(src, dst, follow_symlinks=False)
+
+def pathSize(path):
+    if not os.path.isdir(path) or os.path.islink(path):
+        return os.lstat(path).st_size
+    return sum(os.lstat(os.path.join(dirpath, f)).st_size for dirpath, _, filenames in os.walk(path) for f in filenames)
+
+class BuildCache:
+    # The entry of a build is the directory <root>/<sim>/<key>, holding the files of the build and
+    # a meta.json listing them with their size. The modification time of meta.json is the last use.
+    def __init__(self, root=CACHEDIR, maxbytes=None):
+        self.root = root
+        self.maxbytes = parseSize(CACHESIZE) if maxbytes is None else maxbytes
+
+    def entry(self, sim, key):
+        return os.path.join(self.root, sim, key)
+
+    def restore(self, sim, key, workdir):
+        # replaces workdir with the files of a cached build; returns False if there is none
+        entry = self.entry(sim, key)
+        try:
+            with open(os.path.join(entry, "meta.json")) as f:
+                files = json.load(f)["files"]
+            shutil.rmtree(workdir, ignore_errors=True)
+            os.makedirs(workdir)
+            for name in files:
+                copyPath(os.path.join(entry, name), os.path.join(workdir, name))
+            os.utime(os.path.join(entry, "meta.json"))
+        except (OSError, ValueError, KeyError): # not cached, or evicted while it was being copied
+            shutil.rmtree(workdir, ignore_errors=True)
+            return False
+        print(f"Restored {sim} build {key} from {self.root}")
+        return True
+
+    def store(self, sim, key, workdir, files):
+        # copies files of workdir into the cache, unless the build is already there
+        entry = self.entry(sim, key)
+        if os.path.isdir(entry):
+            return
+        tmp = os.path.join(self.root, sim, f".tmp-{socket.gethostname()}-{os.getpid()}-{key}")
+        try:
+            os.makedirs(tmp)
+            for name in files:
+                copyPath(os.path.join(workdir, name), os.path.join(tmp, name))
+            size = sum(pathSize(os.path.join(tmp, name)) for name in files)
+            with open(os.path.join(tmp, "meta.json"), "w") as f:
+                json.dump({"files": files, "bytes": size, "host": socket.gethostname(),
+                           "created": time.strftime("%Y-%m-%dT%H:%M:%S")}, f)
+            os.rename(tmp, entry)
+        except OSError: # another run stored the build first, or the cache is full or read-only
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self.evict()
+
+    def entries(self):
+        # returns (last use, bytes, sim, key) of each entry, least recently used first
+        entries = []
+        for sim in SIMFILES:
+            simdir = os.path.join(self.root, sim)
+            for key in os.listdir(simdir) if os.path.isdir(simdir) else []:
+                path = os.path.join(simdir, key)
+                if key.startswith("."):
+                    try: # leftovers of runs that died while storing or evicting
+                        if time.time() - os.stat(path).st_mtime > STALE:
+                            shutil.rmtree(path, ignore_errors=True)
+                    except OSError:
+                        pass
+                    continue
+                try:
+                    meta = os.path.join(path, "meta.json")
+                    with open(meta) as f:
+                        entries.append((os.stat(meta).st_mtime, json.load(f)["bytes"], sim, key))
+                except (OSError, ValueError, KeyError):
+                    continue
+        return sorted(entries)
+
+    def remove(self, sim, key):
+        # renames the entry out of the way first so no run restores half of it
+        doomed = os.path.join(self.root, sim, f".evict-{socket.gethostname()}-{os.getpid()}-{key}")
+        try:
+            os.rename(self.entry(sim, key), doomed)
+        except OSError: # another run removed it
+            return
+        shutil.rmtree(doomed, ignore_errors=True)
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(entry[1] for entry in entries)
+        for lastuse, size, sim, key in entries:
+            if total <= self.maxbytes:
+                break
+            self.remove(sim, key)
+            total -= size
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description="Lists, trims, or empties the cache of compiled simulation models.")
+    parser.add_argument("--list", "-l", help="List the cached builds, least recently used first", action="store_true")
+    parser.add_argument("--evict", "-e", help="Remove least recently used builds until the cache fits $WALLY_BUILD_CACHE_SIZE", action="store_true")
+    parser.add_argument("--clear", "-c", help="Remove every cached build", action="store_true")
+    return parser.parse_args()
+
+def main(args):
+    if not enabled():
+        print("The build cache is disabled (WALLY_BUILD_CACHE=off)")
+        return 0
+    cache = BuildCache()
+    if args.clear:
+        for lastuse, size, sim, key in cache.entries():
+            cache.remove(sim, key)
+    if args.evict:
+        cache.evict()
+    entries = cache.entries()
+    if args.list:
+        for lastuse, size, sim, key in entries:
+            print(f"{sim:<10} {key} {size/(1 << 20):>10.1f} MiB  last used {time.strftime('%Y-%m-%d %H:%M', time.localtime(lastuse))}")
+    print(f"{cache.root}: {len(entries)} builds, {sum(entry[1] for entry in entries)/(1 << 30):.2f} of {cache.maxbytes/(1 << 30):.2f} GiB")
+    return 0
+
+if __name__ == "__main__":
+    args = parseArgs()
+    sys.exit(main(args))
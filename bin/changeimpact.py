@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+#
+# changeimpact.py
+# 17 October 2026
+# Maps the files changed since a git revision to the test cases they can affect
+# usage: changeimpact.py REV [CONFIG ...]
+#
+# regression-wally --changed-since REV runs only the test cases this selects. Each file that
+# differs between REV and the working tree gets a rule:
+#   config/<config>      that configuration and the derivatives built on it
+#   config/derivlist.txt the derivatives whose definition differs from the one at REV, and
+#                        the derivatives built on them
+#   src/**.sv            the configurations that instantiate a module of the file: the module
+#                        hierarchy is followed down from the top, skipping the instances under
+#                        generate ifs that are false for the configuration's parameters
+#                        (conditions that cannot be worked out count as true)
+#   sim/<simulator>      the test cases run on that simulator
+#   tests, benchmarks,   the test cases running programs from the file's directory or named
+#   addins/cvw-arch-verif after one of its directories (every test case if there are none)
+#   docs, fpga, synthDC, nothing
+#   and the like
+#   anything else        every test case, e.g. config/shared, testbench, or bin/wsim
+# The module hierarchy is cached in $WALLY/sim/module_graph.json, and only the source files
+# that changed since it was written are parsed again.
+#
+# SPDX-License-Identifier: Apache-2.0 WITH SHL-2.1
+
+import argparse
+import json
+import operator
+import os
+import re
+import subprocess
+import sys
+
+# Global variables
+WALLY = os.environ.get("WALLY")
+GRAPHCACHE = f"{WALLY}/sim/module_graph.json"
+SIMS = ["questa", "verilator", "vcs", "xcelium"]
+IGNORED = ["docs/", "fpga/", "synthDC/", "examples/", "studies/", "linux/", ".github/"]
+TESTDIRS = ["tests/", "benchmarks/", "addins/cvw-arch-verif"]
+# where new files that are not in git yet count; elsewhere they are mostly build and simulation output
+UNTRACKED = ["src/", "testbench/", "config/"]
+# files that only affect the test cases whose command contains the text
+COMMANDFILES = {"testbench/testbench_fp.sv": "testbench_fp", "bin/lint-wally": "lint-wally"}
+
+COMMENT = re.compile(r'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\])*"', re.S)
+TOKEN = re.compile(r"[A-Za-z_$][\w$]*|\d*'[sS]?[bodhBODH][0-9a-fA-F_xzXZ]+|\d+|\S")
+PARAM = re.compile(r"^\s*localparam\b[^=;]*?\b(\w+)\s*=\s*([^;]+);", re.M)
+LITERAL = re.compile(r"\s*(?:\d*'[sS]?([bodhBODH])([0-9a-fA-F_]+)|(\d+))\s*")
+BASES = {"b": 2, "o": 8, "d": 10, "h": 16}
+CONDTOKEN = re.compile(r"\s*(?:(\d*'[sS]?[bodhBODH][0-9a-fA-F_xzXZ]+|\d+)|P\.(\w+)|(\w+)|(===|!==|==|!=|<=|>=|<<|>>|&&|\|\||[-+*/%<>!~&|^()?:]))")
+# binary operators of generate conditions from the loosest binding to the tightest; parseModules
+# joins conditions with and and not
+LEVELS = [["||", "or"], ["&&", "and"], ["|"], ["^"], ["&"], ["==", "!=", "===", "!=="],
+          ["<", "<=", ">", ">="], ["<<", ">>"], ["+", "-"], ["*", "/", "%"]]
+OPERATORS = {"||": lambda a, b: bool(a) or bool(b), "or": lambda a, b: bool(a) or bool(b),
+             "&&": lambda a, b: bool(a) and bool(b), "and": lambda a, b: bool(a) and bool(b),
+             "|": operator.or_, "^": operator.xor, "&": operator.and_,
+             "==": operator.eq, "!=": operator.ne, "===": operator.eq, "!==": operator.ne,
+             "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+             "<<": operator.lshift, ">>": operator.rshift, "+": operator.add, "-": operator.sub,
+             "*": operator.mul, "/": operator.floordiv, "%": operator.mod}
+
+def git(*args):
+    return subprocess.run(["git", "-C", WALLY, *args], capture_output=True, text=True, check=True).stdout
+
+def changedFiles(rev):
+    # the files that differ between rev and the working tree, including new sources not in git yet
+    files = git("diff", "--name-only", "--no-renames", rev).split()
+    files += [path for path in git("ls-files", "--others", "--exclude-standard").split()
+              if path.startswith(tuple(UNTRACKED)) and not path.startswith("config/deriv/")]
+    return sorted(set(files))
+
+def literal(text):
+    # the value of a plain decimal or sized number, or None
+    m = LITERAL.fullmatch(text)
+    if not m:
+        return None
+    return int(m[3]) if m[3] else int(m[2].replace("_", ""), BASES[m[1].lower()])
+
+def derivDefinitions(text):
+    # returns {derivative: (base configuration, [(parameter, value)])} from the text of
+    # derivlist.txt, including the parameters each derivative inherits, as derivgen.pl does
+    derivs = {}
+    entries = None
+    for line in text.splitlines():
+        tokens = line.split()
+        if not tokens or tokens[0].startswith("#"):
+            continue
+        if tokens[0] == "deriv":
+            entries = list(derivs[tokens[3]][1]) if len(tokens) > 3 and tokens[3] in derivs else []
+            derivs[tokens[1]] = (tokens[2], entries)
+        elif entries is not None:
+            entries.append((tokens[0], " ".join(tokens[1:])))
+    return derivs
+
+def readDerivs(rev=None):
+    # the derivative definitions of the working tree, or of rev
+    try:
+        if rev:
+            return derivDefinitions(git("show", f"{rev}:config/derivlist.txt"))
+        with open(f"{WALLY}/config/derivlist.txt") as f:
+            return derivDefinitions(f.read())
+    except (OSError, subprocess.CalledProcessError):
+        return {}
+
+def descendants(configs, derivs):
+    # configs and the derivatives built on any of them, directly or through other derivatives
+    affected = set(configs)
+    grown = True
+    while grown:
+        more = {deriv for deriv, (base, _) in derivs.items() if base in affected} - affected
+        affected |= more
+        grown = bool(more)
+    return affected
+
+def configParams(config, derivs):
+    # returns {parameter: value} of the parameters of a configuration that have plain numeric
+    # values; like derivgen.pl, a derivative starts from the config.vh of its base
+    path = f"{WALLY}/config/{config}/config.vh"
+    if not os.path.isfile(path) and config in derivs:
+        base, entries = derivs[config]
+        params = configParams(base, derivs)
+        for name, value in entries:
+            params[name] = literal(value)
+        return {name: value for name, value in params.items() if value is not None}
+    try:
+        with open(path, errors="ignore") as f:
+            text = COMMENT.sub(" ", f.read())
+    except OSError:
+        return {}
+    params = {name: literal(value) for name, value in PARAM.findall(text)}
+    return {name: value for name, value in params.items() if value is not None}
+
+def evaluate(condition, params):
+    # the value of a generate condition for a configuration, or True if it cannot be worked out
+    # exactly: it uses a parameter without a numeric value, something other than numbers and the
+    # operators in LEVELS, !, and ?:, or anything whose value depends on the width of its operands,
+    # like ~, a negation, or a subtraction going below 0
+    try:
+        tokens = conditionTokens(condition, params)
+        value, i = conditionValue(tokens, 0)
+        return bool(value) if i == len(tokens) else True
+    except (KeyError, IndexError, ValueError, ZeroDivisionError):
+        return True
+
+def conditionTokens(condition, params):
+    # the numbers, with the parameters' values filled in, and operators of a condition
+    tokens = []
+    pos = 0
+    condition = condition.rstrip()
+    while pos < len(condition):
+        m = CONDTOKEN.match(condition, pos)
+        if not m:
+            raise ValueError(condition)
+        number, param, word, op = m.groups()
+        if number is not None:
+            value = literal(number)
+            if value is None:
+                raise ValueError(number)
+            tokens.append(value)
+        elif param is not None:
+            tokens.append(params[param])
+        elif word in ["and", "or", "not"]:
+            tokens.append(word)
+        elif word is not None:
+            raise ValueError(word)
+        else:
+            tokens.append(op)
+        pos = m.end()
+    return tokens
+
+def conditionValue(tokens, i, level=0):
+    # the value of the expression starting at tokens[i] and the index just past it
+    if level == 0:
+        value, i = conditionValue(tokens, i, 1)
+        if i < len(tokens) and tokens[i] == "?":
+            iftrue, i = conditionValue(tokens, i + 1)
+            if tokens[i] != ":":
+                raise ValueError(":")
+            iffalse, i = conditionValue(tokens, i + 1)
+            value = iftrue if value else iffalse
+        return value, i
+    if level <= len(LEVELS):
+        value, i = conditionValue(tokens, i, level + 1)
+        while i < len(tokens) and tokens[i] in LEVELS[level - 1]:
+            op = tokens[i]
+            right, i = conditionValue(tokens, i + 1, level + 1)
+            value = binaryValue(op, value, right)
+        return value, i
+    tok = tokens[i]
+    if tok in ["!", "not"]:
+        value, i = conditionValue(tokens, i + 1, level)
+        return int(not value), i
+    if tok == "+":
+        return conditionValue(tokens, i + 1, level)
+    if tok == "(":
+        value, i = conditionValue(tokens, i + 1)
+        if tokens[i] != ")":
+            raise ValueError(")")
+        return value, i + 1
+    if isinstance(tok, int):
+        return tok, i + 1
+    raise ValueError(tok) # ~, -, and the reduction operators depend on widths
+
+def binaryValue(op, left, right):
+    # Python's integers never wrap, so results that would in Verilog are not worked out
+    if (op == "-" and right > left) or (op in ["<<", ">>"] and right > 64):
+        raise ValueError(op)
+    return int(OPERATORS[op](left, right))
+
+def matchParen(tokens, i):
+    # the index of the ) closing the ( at tokens[i]
+    depth = 0
+    for j in range(i, len(tokens)):
+        depth += {"(": 1, ")": -1}.get(tokens[j][0], 0)
+        if depth == 0:
+            return j
+    return len(tokens) - 1
+
+def parseModules(text):
+    # Returns {module: [[instantiated module, [generate conditions it is under]]]} of a source
+    # file. Anything written like an instantiation is listed; moduleGraph's users only follow
+    # the names of modules. The body of an if is under its condition, that of an else under the
+    # negation, and a condition that cannot be followed is dropped, which only adds instances.
+    text = COMMENT.sub(" ", text)
+    tokens = [(m.group(), m.start(), m.end()) for m in TOKEN.finditer(text)]
+    modules = {}
+    module = None
+    frames = []       # (kind, condition, (prefix, condition of the if)) of the enclosing bodies
+    pending = None    # the frame of the if or else whose body starts at the next token
+    lastif = None     # (prefix, condition) of the if that just ended, for an else
+    depth = 0
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i][0]
+        endedif, lastif = lastif, None
+        if tok == "module" and i + 1 < len(tokens):
+            module = tokens[i + 1][0]
+            modules[module] = []
+            frames, pending, depth = [], None, 0
+            i += 2
+            continue
+        if module is None:
+            i += 1
+            continue
+        if pending and tok != "if":
+            if tok == "begin":
+                frames.append(("begin", *pending))
+                pending = None
+                i += 3 if i + 1 < len(tokens) and tokens[i + 1][0] == ":" else 1
+                continue
+            frames.append(("statement", *pending))
+            pending = None
+        if tok == "endmodule":
+            module = None
+        elif tok == "if" and i + 1 < len(tokens) and tokens[i + 1][0] == "(":
+            close = matchParen(tokens, i + 1)
+            condition = text[tokens[i + 1][2]:tokens[close][1]].strip()
+            prefix = pending[0] if pending else None
+            pending = (f"({prefix}) and ({condition})" if prefix else condition, (prefix, condition))
+            i = close
+        elif tok == "else":
+            prefix, condition = endedif or (None, None)
+            guard = None if condition is None else f"not ({condition})"
+            pending = (f"({prefix}) and ({guard})" if prefix and guard else guard, None)
+        elif tok == "begin":
+            frames.append(("begin", None, None))
+        elif tok in ["end", "endcase"]:
+            if tok == "end":
+                while frames:
+                    kind, _, ifinfo = frames.pop()
+                    if kind == "begin":
+                        lastif = ifinfo
+                        break
+                if i + 1 < len(tokens) and tokens[i + 1][0] == ":": # end : label
+                    i += 2
+            while frames and frames[-1][0] == "statement":
+                ifinfo = frames.pop()[2]
+                lastif = lastif or ifinfo
+        elif tok == "(":
+            depth += 1
+        elif tok == ")":
+            depth -= 1
+        elif tok == ";" and depth == 0:
+            while frames and frames[-1][0] == "statement":
+                ifinfo = frames.pop()[2]
+                lastif = lastif or ifinfo
+        elif depth == 0 and i + 2 < len(tokens) and re.fullmatch(r"[A-Za-z_]\w*", tok) and \
+                (tokens[i + 1][0] == "#" or (re.fullmatch(r"[A-Za-z_]\w*", tokens[i + 1][0]) and tokens[i + 2][0] in ["(", "["])):
+            modules[module].append([tok, [condition for _, condition, _ in frames if condition]])
+        i += 1
+    return modules
+
+def moduleGraph():
+    # returns {source file relative to WALLY: {"stamp": ..., "modules": parseModules of it}} for
+    # the files of src, parsing only the files that changed since the cached graph was written
+    try:
+        with open(GRAPHCACHE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    graph = {}
+    for dirpath, dirnames, filenames in os.walk(f"{WALLY}/src"):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if not name.endswith((".sv", ".v")):
+                continue
+            path = os.path.join(dirpath, name)
+            rel = os.path.relpath(path, WALLY)
+            stat = os.stat(path)
+            stamp = [stat.st_mtime_ns, stat.st_size]
+            if rel in cache and cache[rel]["stamp"] == stamp:
+                graph[rel] = cache[rel]
+            else:
+                with open(path, errors="ignore") as f:
+                    graph[rel] = {"stamp": stamp, "modules": parseModules(f.read())}
+    if graph != cache:
+        tmp = f"{GRAPHCACHE}.{os.getpid()}"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(graph, f)
+            os.replace(tmp, GRAPHCACHE)
+        except OSError: # e.g. a read-only tree; the graph is only a cache
+            pass
+    return graph
+
+def reachedModules(config, edges, derivs):
+    # the modules a configuration instantiates, starting from the modules that no other one does
+    params = configParams(config, derivs)
+    values = {}
+    def holds(condition):
+        if condition not in values:
+            values[condition] = evaluate(condition, params)
+        return values[condition]
+    instantiated = {child for children in edges.values() for child, _ in children}
+    reached = {module for module in edges if module not in instantiated}
+    todo = list(reached)
+    while todo:
+        for child, conditions in edges[todo.pop()]:
+            if child in edges and child not in reached and all(holds(condition) for condition in conditions):
+                reached.add(child)
+                todo.append(child)
+    return reached
+
+def impact(rev, configs):
+    # Returns (changed file, kind, what) for each file changed since rev, where kind is
+    #   "configs": it affects the test cases of the configurations in the set what, out of configs
+    #   "sim":     it affects the test cases run on the simulator what
+    #   "command": it affects the test cases whose command contains what
+    #   "tests":   it is part of a test program (see the top of this file)
+    #   "all":     it can affect every test case
+    #   "none":    it affects none
+    derivs = readDerivs()
+    graph = edges = None
+    reached = {}
+    rules = []
+    for path in changedFiles(rev):
+        parts = path.split("/")
+        if path in COMMANDFILES:
+            rules.append((path, "command", COMMANDFILES[path]))
+        elif path.endswith(".md") or any(path.startswith(prefix) for prefix in IGNORED):
+            rules.append((path, "none", None))
+        elif path == "config/derivlist.txt":
+            old = readDerivs(rev)
+            changed = {deriv for deriv, definition in derivs.items() if old.get(deriv) != definition}
+            rules.append((path, "configs", descendants(changed, derivs) & set(configs)))
+        elif parts[0] == "config" and len(parts) > 2 and parts[1] != "shared":
+            config = parts[2] if parts[1] == "deriv" and len(parts) > 3 else parts[1]
+            rules.append((path, "configs", descendants({config}, derivs) & set(configs)))
+        elif parts[0] == "src" and path.endswith((".sv", ".v")):
+            if graph is None:
+                graph = moduleGraph()
+                edges = {}
+                for entry in graph.values():
+                    edges.update(entry["modules"])
+            modules = set(graph[path]["modules"]) if path in graph else set()
+            if not modules: # a deleted file, or one that only defines packages or interfaces
+                rules.append((path, "all", None))
+                continue
+            for config in configs:
+                if config not in reached:
+                    reached[config] = reachedModules(config, edges, derivs)
+            rules.append((path, "configs", {config for config in configs if modules & reached[config]}))
+        elif parts[0] == "sim" and len(parts) > 2 and parts[1] in SIMS:
+            rules.append((path, "sim", parts[1]))
+        elif any(path.startswith(prefix) for prefix in TESTDIRS):
+            rules.append((path, "tests", None))
+        else:
+            rules.append((path, "all", None))
+    return rules
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description="Lists the files changed since a git revision and the test cases they can affect.")
+    parser.add_argument("rev", help="git revision to compare the working tree with")
+    parser.add_argument("configs", nargs="*", help="Configurations to consider (default: every configuration and derivative)")
+    return parser.parse_args()
+
+def main(args):
+    configs = args.configs
+    if not configs:
+        configs = sorted(name for name in os.listdir(f"{WALLY}/config") if os.path.isfile(f"{WALLY}/config/{name}/config.vh"))
+        configs += sorted(readDerivs())
+    try:
+        rules = impact(args.rev, configs)
+    except subprocess.CalledProcessError as e:
+        print(f"Error: {e.stderr.strip()}")
+        return 1
+    for path, kind, what in rules:
+        if kind == "configs":
+            print(f"{path}: {len(what)} configurations: {' '.join(sorted(what))}")
+        elif kind in ["sim", "command"]:
+            print(f"{path}: test cases with {kind} {what}")
+        else:
+            print(f"{path}: {kind}")
+    return 0
+
+if __name__ == "__main__":
+    args = parseArgs()
+    sys.exit(main(args))
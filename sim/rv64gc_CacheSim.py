@@ -8,7 +8,7 @@
 ## Modified: 12 April 2023
 ## Modified: 10 August 2023, jcarlin@hmc.edu
 ##
-## Purpose: Run the cache simulator on each rv64gc test suite in turn.
+## Purpose: Run the cache simulator on each rv64gc test suite.
 ##
 ## A component of the CORE-V-WALLY configurable RISC-V project.
 ## https://github.com/openhwgroup/cvw
@@ -29,14 +29,28 @@
 ## and limitations under the License.
 ################################################################################################
 import os
+import sys
+import time
+import signal
 import argparse
 import subprocess
+import importlib.util
+from collections import deque
 
 # NOTE: make sure testbench.sv has the ICache and DCache loggers enabled!
 # This does not check the test output for correctness, run regression for that.
 # Add -p or --perf to report the hit/miss ratio.
 # Add -d or --dist to report the distribution of loads, stores, and atomic ops.
 # These distributions may not add up to 100; this is because of flushes or invalidations.
+# With Verilator, the logger-enabled rv64gc model is compiled once into its own work
+# directory and the suites are simulated concurrently (-j, all cores by default), each
+# in its own directory under sim/<simulator>/cachesim. The ICache and DCache simulators
+# run on each suite's logs as soon as its simulation finishes, while later suites are
+# still simulating. Questa and VCS share one working directory per simulator, so their
+# suites are simulated one at a time, with the cache simulators pipelined behind them.
+# Add -o or --online to check the accesses while the suites simulate: the loggers write
+# into named pipes read by the cache simulators instead of log files, and a suite's
+# simulation is stopped at the first mismatch.
 
 class bcolors:
     HEADER = '\033[95m'
@@ -60,15 +74,56 @@ tests64gc = ["coverage64gc", "wally64priv", "arch64i", "arch64priv", "arch64c",
 
 cachetypes = ["ICache", "DCache"]
 simdir = os.path.expandvars("$WALLY/sim")
+simargs = "I_CACHE_ADDR_LOGGER=1\\'b1 D_CACHE_ADDR_LOGGER=1\\'b1"
+# the work directory of the logger-enabled model is named after this pseudo-test, so
+# it neither clobbers nor is clobbered by the models regression builds without loggers
+modelname = "cachesim"
+
+# compiles the logger-enabled Verilator model, if it is out of date, and returns its path
+def compileVerilator():
+    workdir = f"{simdir}/verilator/wkdir/rv64gc_{modelname}"
+    print(f"{bcolors.HEADER}Compiling the rv64gc model with the cache loggers enabled{bcolors.ENDC}")
+    result = subprocess.run(["make", "-C", f"{simdir}/verilator", f"{workdir}/Vtestbench",
+                             "WALLYCONF=rv64gc", f"TEST={modelname}", f"PARAM_ARGS={simargs}"], stdout=subprocess.DEVNULL)
+    return f"{workdir}/Vtestbench" if result.returncode == 0 else None
+
+# the log a suite's simulation writes, which Questa and VCS write in their own directory
+def logPath(args, model, testdir, cache):
+    return f"{testdir}/{cache}.log" if model or not args.online else f"{simdir}/{args.sim}/{cache}.log"
+
+# returns the shell command that simulates a suite, leaving its logs in testdir
+def simCommand(args, model, test, testdir):
+    if model:
+        return f"{model} +TEST={test} > {testdir}/sim.out 2>&1"
+    # remove wkdir to force recompile with logging enabled
+    cmd = f"rm -rf {simdir}/{args.sim}/wkdir/rv64gc_{test}; "
+    if not args.online:
+        cmd += f"rm -rf {simdir}/{args.sim}/*Cache.log; "
+    cmd += f'wsim --sim {args.sim} rv64gc {test} --params "{simargs}" > {testdir}/sim.out 2>&1'
+    if not args.online:
+        cmd += f"; mv {simdir}/{args.sim}/*Cache.log {testdir}"
+    return cmd
+
+# A cache simulator waiting for a simulation that died before opening the pipe
+# would wait forever, so the pipe is opened and closed to give it an end of file.
+# Returns False if the cache simulator has not opened the pipe yet, in which case
+# opening it now would not reach it and this has to be tried again later.
+def releasePipe(path):
+    try:
+        os.close(os.open(path, os.O_WRONLY | os.O_NONBLOCK))
+    except OSError: # no one is reading the pipe
+        return False
+    return True
 
 def main():
     parser = argparse.ArgumentParser(description="Runs the cache simulator on all rv64gc test suites")
     parser.add_argument('-p', "--perf", action='store_true', help="Report hit/miss ratio")
     parser.add_argument('-d', "--dist", action='store_true', help="Report distribution of operations")
     parser.add_argument('-s', "--sim", help="Simulator", choices=["questa", "verilator", "vcs"], default="verilator")
+    parser.add_argument('-j', "--jobs", type=int, default=os.cpu_count(), help="Number of simulations and cache simulators to run at once")
+    parser.add_argument('-t', "--tests", nargs='+', default=tests64gc, help="Test suites to run")
+    parser.add_argument('-o', "--online", action='store_true', help="Check through named pipes while simulating, stopping at the first mismatch")
     args = parser.parse_args()
-    simargs = "I_CACHE_ADDR_LOGGER=1\\'b1 D_CACHE_ADDR_LOGGER=1\\'b1"
-    testcmd = "wsim --sim " + args.sim + ' rv64gc {} --params "' + simargs + '" > /dev/null'
     #cachecmd = "CacheSim.py 64 4 56 44 -f {} --verbose"
     cachecmd = "CacheSim.py 64 4 56 44 -f {}"
     mismatches = 0
@@ -77,21 +132,89 @@ def main():
         cachecmd += " -p"
     if args.dist:
         cachecmd += " -d"
+    if importlib.util.find_spec("numpy"):
+        cachecmd += " -e numpy" # same results as the default engine, much faster
+    if args.online:
+        cachecmd += " --stop-on-mismatch"
+
+    model = None
+    if args.sim == "verilator":
+        model = compileVerilator()
+        if model is None:
+            print(f"{bcolors.FAIL}Compiling the rv64gc model failed{bcolors.ENDC}")
+            return 1
+    logdir = f"{simdir}/{args.sim}/cachesim"
+    simslots = args.jobs if model else 1
 
-    for test in tests64gc:
-        print(f"{bcolors.HEADER}Commencing test", test+f":{bcolors.ENDC}")
-        # remove wkdir to force recompile with logging enabled
-        os.system("rm -rf " + simdir + "/" + args.sim + "/wkdir/rv64gc_" + test)
-        os.system("rm -rf " + simdir + "/" + args.sim + "/*Cache.log")
-        print(testcmd.format(test))
-        os.system(testcmd.format(test))
-        for cache in cachetypes:
-            print(f"{bcolors.OKCYAN}Running the", cache, f"simulator.{bcolors.ENDC}")
-            result = subprocess.run(cachecmd.format(args.sim+"/"+cache+".log"), shell=True)
-            mismatches += result.returncode
-        print()
+    # Simulations and cache simulators share the job slots. A finished simulation
+    # queues the cache simulators of its suite ahead of the remaining simulations, and
+    # the suites are reported in order as their cache simulators finish.
+    # Online, the cache simulators of a suite start with its simulation and only the
+    # simulations count against the job slots, since the checkers keep pace with them.
+    sims = deque(args.tests)
+    checks = deque()
+    running = {}
+    simprocs = {}
+    outputs = {test: {} for test in args.tests}
+    unreleased = set() # (test, cache) of the pipes of finished simulations to release
+    reported = 0
+    def startCheck(test, cache):
+        cmd = cachecmd.format(logPath(args, model, f"{logdir}/{test}", cache)) + f" > {logdir}/{test}/{cache}.out 2>&1"
+        running[subprocess.Popen(cmd, shell=True)] = ("check", test, cache)
+    while sims or checks or running:
+        while checks and len(running) < args.jobs:
+            startCheck(*checks.popleft())
+        # Questa and VCS write every suite's logs to the same pipes, so the next suite can
+        # only replace them once the cache simulators of the last one have opened them
+        while sims and len(simprocs) < simslots and (args.online or len(running) < args.jobs) and not (unreleased and not model):
+            test = sims.popleft()
+            testdir = f"{logdir}/{test}"
+            subprocess.run(["rm", "-rf", testdir])
+            os.makedirs(f"{testdir}/logs")
+            if args.online:
+                for cache in cachetypes:
+                    if os.path.lexists(logPath(args, model, testdir, cache)):
+                        os.remove(logPath(args, model, testdir, cache))
+                    os.mkfifo(logPath(args, model, testdir, cache))
+                    startCheck(test, cache)
+            # in a session of its own, so that it can be killed with everything it started
+            simprocs[test] = subprocess.Popen(simCommand(args, model, test, testdir), shell=True, cwd=testdir, start_new_session=True)
+            running[simprocs[test]] = ("sim", test, None)
+        time.sleep(0.1)
+        for proc in [proc for proc in running if proc.poll() is not None]:
+            kind, test, cache = running.pop(proc)
+            if kind == "sim":
+                del simprocs[test]
+                if args.online:
+                    unreleased.update((test, cache) for cache in cachetypes)
+                else:
+                    checks.extend((test, cache) for cache in cachetypes)
+            else:
+                outputs[test][cache] = proc.returncode
+                if proc.returncode and test in simprocs:
+                    # a checker stopped at a mismatch, so the rest of the run is moot
+                    try:
+                        os.killpg(simprocs[test].pid, signal.SIGTERM)
+                    except ProcessLookupError: # it has just finished
+                        pass
+        # until its cache simulator has finished or been released, as it may not have
+        # opened the pipe yet when the simulation finished
+        checking = {(test, cache) for kind, test, cache in running.values() if kind == "check"}
+        for test, cache in list(unreleased):
+            if (test, cache) not in checking or releasePipe(logPath(args, model, f"{logdir}/{test}", cache)):
+                unreleased.discard((test, cache))
+        while reported < len(args.tests) and len(outputs[args.tests[reported]]) == len(cachetypes):
+            test = args.tests[reported]
+            print(f"{bcolors.HEADER}Results of test", test+f":{bcolors.ENDC}")
+            for cache in cachetypes:
+                print(f"{bcolors.OKCYAN}The", cache, f"simulator:{bcolors.ENDC}")
+                with open(f"{logdir}/{test}/{cache}.out") as f:
+                    sys.stdout.write(f.read())
+                mismatches += outputs[test][cache]
+            print()
+            sys.stdout.flush()
+            reported += 1
     return mismatches
 
 if __name__ == '__main__':
     exit(main())
-
@@ -0,0 +1,160 @@
+// warm.cpp
+// main() of the Verilator model of testbench
+// SPDX-License-Identifier: Apache-2.0 WITH SHL-2.1
+//
+// Without WALLY_WARM_SOCKET in the environment, the model runs once, as with the main()
+// of verilator --binary. With it, the model is constructed once and then serves the runs
+// that wsim --warm requests over that Unix socket, so that short tests skip starting the
+// process and constructing the model. A request is one packet holding the working
+// directory, the NAME=value variables of the client's environment, which replaces that of
+// the server for the run, an empty string, and the plusargs of the run, each ended by a NUL,
+// and the client's stdout and stderr. Each run is a fork of the constructed model, made before
+// its first eval so the initial blocks and static initializers read the plusargs and
+// environment of the run. The reply is "exit <status>". A run whose
+// client goes away is killed, and the server exits after WALLY_WARM_IDLE seconds (300 by
+// default) without requests.
+
+#include <cerrno>
+#include <csignal>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <memory>
+#include <string>
+#include <vector>
+
+#include <poll.h>
+#include <sys/socket.h>
+#include <sys/un.h>
+#include <sys/wait.h>
+#include <unistd.h>
+
+#include "verilated.h"
+#include "Vtestbench.h"
+
+static int simulate(VerilatedContext* contextp, Vtestbench* topp) {
+  while (VL_LIKELY(!contextp->gotFinish())) {
+    topp->eval();
+    if (!topp->eventsPending()) break;
+    contextp->time(topp->nextTimeSlot());
+  }
+  if (VL_LIKELY(!contextp->gotFinish())) {
+    VL_DEBUG_IF(VL_PRINTF("+ Exiting without $finish; no events left\n"););
+  }
+  topp->final();
+  contextp->statsPrintSummary();
+  return 0;
+}
+
+// Runs in a fork of the server for each request: runs the model in a fork of its own with
+// the client's arguments, directory, environment, and output, and replies with how that exited.
+static void serve(int conn, VerilatedContext* contextp, Vtestbench* topp) {
+  std::vector<char> buf(1 << 20);
+  char control[CMSG_SPACE(2 * sizeof(int))];
+  iovec iov{buf.data(), buf.size() - 1};
+  msghdr msg{};
+  msg.msg_iov = &iov;
+  msg.msg_iovlen = 1;
+  msg.msg_control = control;
+  msg.msg_controllen = sizeof(control);
+  const ssize_t n = recvmsg(conn, &msg, 0);
+  cmsghdr* cmsg = CMSG_FIRSTHDR(&msg);
+  if (n <= 0 || (msg.msg_flags & (MSG_TRUNC | MSG_CTRUNC)) || !cmsg || cmsg->cmsg_type != SCM_RIGHTS ||
+      cmsg->cmsg_len != CMSG_LEN(2 * sizeof(int)))
+    _exit(1); // no reply, which the client takes as a failed run
+  int fds[2];
+  memcpy(fds, CMSG_DATA(cmsg), sizeof(fds));
+  buf[n] = '\0';
+  const char* cwd = buf.data();
+  std::vector<const char*> env;
+  std::vector<const char*> argv{"Vtestbench"};
+  const char* arg = cwd + strlen(cwd) + 1;
+  for (; arg < buf.data() + n && *arg; arg += strlen(arg) + 1) env.push_back(arg);
+  for (arg += 1; arg < buf.data() + n; arg += strlen(arg) + 1) argv.push_back(arg);
+
+  const pid_t sim = fork();
+  if (sim == 0) {
+    close(conn);
+    dup2(fds[0], STDOUT_FILENO);
+    dup2(fds[1], STDERR_FILENO);
+    close(fds[0]);
+    close(fds[1]);
+    clearenv();
+    for (const char* var : env) putenv(const_cast<char*>(var)); // buf outlives the run
+    if (chdir(cwd)) {
+      perror(cwd);
+      _exit(1);
+    }
+    contextp->commandArgs(argv.size(), argv.data()); // replaces the arguments of the server
+    exit(simulate(contextp, topp)); // exit rather than _exit flushes the output
+  }
+  close(fds[0]);
+  close(fds[1]);
+  int status = 1 << 8; // exit 1 if the fork failed
+  while (sim > 0 && waitpid(sim, &status, WNOHANG) == 0) {
+    pollfd client{conn, POLLIN, 0};
+    if (poll(&client, 1, 200) <= 0) continue;
+    char c;
+    const ssize_t got = recv(conn, &c, 1, MSG_DONTWAIT);
+    if (got == 0 || (got < 0 && errno != EAGAIN && errno != EWOULDBLOCK)) { // the client sends nothing more, so it has gone
+      kill(sim, SIGKILL);
+      waitpid(sim, &status, 0);
+      _exit(1);
+    }
+  }
+  const int code = WIFEXITED(status) ? WEXITSTATUS(status) : 128 + WTERMSIG(status);
+  const std::string reply = "exit " + std::to_string(code) + "\n";
+  send(conn, reply.data(), reply.size(), MSG_NOSIGNAL);
+  _exit(0);
+}
+
+static int server(const char* path, VerilatedContext* contextp, Vtestbench* topp) {
+  sockaddr_un addr{};
+  addr.sun_family = AF_UNIX;
+  if (strlen(path) >= sizeof(addr.sun_path)) {
+    fprintf(stderr, "Error: socket path is too long: %s\n", path);
+    return 1;
+  }
+  strcpy(addr.sun_path, path);
+  const int listener = socket(AF_UNIX, SOCK_SEQPACKET, 0);
+  unlink(path);
+  if (listener < 0 || bind(listener, reinterpret_cast<sockaddr*>(&addr), sizeof(addr)) || listen(listener, 64)) {
+    perror(path);
+    return 1;
+  }
+  const char* idle = getenv("WALLY_WARM_IDLE");
+  const int idleMs = (idle && *idle ? atoi(idle) : 300) * 1000;
+  signal(SIGCHLD, SIG_IGN); // reap the forks serving requests
+  printf("Serving runs of the model on %s\n", path);
+  fflush(stdout);
+  while (true) {
+    pollfd p{listener, POLLIN, 0};
+    const int ready = poll(&p, 1, idleMs);
+    if (ready < 0 && errno == EINTR) continue;
+    if (ready <= 0) break; // idle for too long
+    const int conn = accept(listener, nullptr, nullptr);
+    if (conn < 0) continue;
+    fflush(stdout);
+    if (fork() == 0) { // the model runs on this one thread, so a fork holds all of it
+      close(listener);
+      signal(SIGCHLD, SIG_DFL);
+      serve(conn, contextp, topp);
+    }
+    close(conn);
+  }
+  printf("No runs for %d s; exiting\n", idleMs / 1000);
+  unlink(path);
+  return 0;
+}
+
+int main(int argc, char** argv, char**) {
+  Verilated::debug(0);
+  const std::unique_ptr<VerilatedContext> contextp{new VerilatedContext};
+  contextp->traceEverOn(true);
+  contextp->threads(1);
+  contextp->commandArgs(argc, argv);
+  const std::unique_ptr<Vtestbench> topp{new Vtestbench{contextp.get(), ""}};
+  const char* socketPath = getenv("WALLY_WARM_SOCKET");
+  if (socketPath && *socketPath) return server(socketPath, contextp.get(), topp.get());
+  return simulate(contextp.get(), topp.get());
+}